@@ -0,0 +1,93 @@
+"""Measure building and searching the member name index of a large
+guild, compared with going through every member.
+
+Run from the repository root with
+``python3 benchmarks/bench_member_index.py [members]``. The default is
+250,000 members.
+"""
+import os
+import random
+import statistics
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.member_index import GuildNameIndex, MemberNameIndex, scan_members  # noqa: E402
+
+
+class FakeMember:
+    __slots__ = ('id', 'name', 'display_name')
+
+    def __init__(self, member_id, name, display_name):
+        self.id = member_id
+        self.name = name
+        self.display_name = display_name
+
+
+def make_members(count, seed=0):
+    rng = random.Random(seed)
+    members = []
+    for member_id in range(count):
+        name = ''.join(rng.choices(string.ascii_letters + string.digits, k=rng.randint(4, 16)))
+        nick = name if rng.random() < 0.7 else ''.join(rng.choices(string.ascii_letters, k=rng.randint(3, 12)))
+        members.append(FakeMember(10 ** 17 + member_id, name, nick))
+    return members
+
+
+def per_call(function, queries, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for query in queries:
+            function(query)
+        best = min(best, time.perf_counter() - start)
+    return best / len(queries)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 250000
+    members = make_members(count)
+    rng = random.Random(1)
+    sample = rng.sample(members, 200)
+
+    chunk_size = MemberNameIndex().chunk_size
+    chunk_times = []
+    start = time.perf_counter()
+    index = GuildNameIndex()
+    for offset in range(0, count, chunk_size):
+        chunk_start = time.perf_counter()
+        index.extend(members[offset:offset + chunk_size])
+        chunk_times.append(time.perf_counter() - chunk_start)
+    extended = time.perf_counter()
+    step_times = []
+    step_start = time.perf_counter()
+    for _ in index.sort_in_steps(2 * chunk_size):
+        step_times.append(time.perf_counter() - step_start)
+        step_start = time.perf_counter()
+    step_times.append(time.perf_counter() - step_start)
+    built = time.perf_counter()
+    print(f'{count} members: indexed in {1000 * (extended - start):.0f} ms, '
+          f'chunks of {chunk_size} take {1000 * statistics.median(chunk_times):.1f} ms '
+          f'(longest {1000 * max(chunk_times):.1f} ms), '
+          f'merged in {1000 * (built - extended):.0f} ms '
+          f'(longest step {1000 * max(step_times):.1f} ms)')
+
+    searches = {
+        'exact': [member.name for member in sample],
+        'prefix': [member.name[:3] for member in sample],
+        'substring': [member.name[1:5] for member in sample if len(member.name) > 5],
+        'missing': ['zz' + member.name for member in sample],
+        'short': [member.name[2:4].lower() for member in sample],
+        'one char': [member.name[3].lower() for member in sample],
+    }
+    print(f'{"search":>10} {"index":>12} {"scan":>12}')
+    for name, queries in searches.items():
+        indexed = per_call(index.find, queries)
+        scanned = per_call(lambda query: scan_members(members, query), queries[:5], repeat=1)
+        print(f'{name:>10} {1000 * indexed:>9.3f} ms {1000 * scanned:>9.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
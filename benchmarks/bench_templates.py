@@ -0,0 +1,54 @@
+"""Compare rendering a compiled tag template with substituting the
+variables with a regex on every call, across tag sizes.
+
+Run from the repository root with ``python3 benchmarks/bench_templates.py``.
+A compiled template without variables takes the same time whatever
+the size of the tag. With variables, only the final join grows with
+the length of the output, while the regex pass searches the whole
+text on every call.
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.templates import Template, variable_rx  # noqa: E402
+
+VALUES = {'user': 'Someone#0001', 'server': 'A Server', 'channel': '#general', 'args': 'some args'}
+SIZES = (100, 1000, 10000, 100000)
+
+
+def render_with_regex(text, **values):
+    return variable_rx.sub(lambda match: values.get(match.group(1), ''), text)
+
+
+def make_text(size, with_variables):
+    filler = 'lorem ipsum dolor sit amet '
+    text = (filler * (size // len(filler) + 1))[:size]
+    if with_variables:
+        text = 'Hi {user}, welcome to {server}! ' + text + ' See {channel}. {args}'
+    return text
+
+
+def measure(function, number):
+    return min(timeit.repeat(function, number=number, repeat=5)) / number
+
+
+def main():
+    print(f'{"size":>8} {"variables":>10} {"template":>12} {"regex":>12} {"speedup":>8}')
+    for with_variables in (False, True):
+        for size in SIZES:
+            text = make_text(size, with_variables)
+            template = Template(text)
+            assert template.render(**VALUES) == render_with_regex(text, **VALUES)
+
+            number = max(10, 1000000 // size)
+            compiled = measure(lambda: template.render(**VALUES), number)
+            regex = measure(lambda: render_with_regex(text, **VALUES), number)
+            print(f'{size:>8} {"yes" if with_variables else "no":>10} '
+                  f'{compiled * 1e6:>9.2f} us {regex * 1e6:>9.2f} us {regex / compiled:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -12,28 +12,28 @@ class Animal(commands.Cog):
     @commands.command()
     async def cat(self, ctx):
         """Get a random picture of a cat."""
-        async with self.bot.session.get('http://aws.random.cat/meow') as r:
-            if r.status == 200:
-                json = await r.json()
-                img = json['file']
-                embed = self._create_embed(img)
-                await ctx.send(embed=embed)
+        # Every request gives a different picture, so responses are not
+        # cached, only shared between requests made at the same time
+        r = await self.bot.http_cache.get('http://aws.random.cat/meow')
+        if r.status == 200:
+            img = r.json()['file']
+            embed = self._create_embed(img)
+            await ctx.send(embed=embed)
 
     @commands.command()
     async def dog(self, ctx):
         """Get a random picture of a dog."""
         img = None
         while not img:
-            async with self.bot.session.get('https://random.dog/woof.json') as r:
-                if r.status == 200:
-                    json = await r.json()
-                    img = json['url']
-                    if img.endswith('.mp4'):
-                        img = None
-                        continue
-                    else:
-                        embed = self._create_embed(img)
-                        await ctx.send(embed=embed)
+            r = await self.bot.http_cache.get('https://random.dog/woof.json')
+            if r.status == 200:
+                img = r.json()['url']
+                if img.endswith('.mp4'):
+                    img = None
+                    continue
+                else:
+                    embed = self._create_embed(img)
+                    await ctx.send(embed=embed)
 
     def _create_embed(self, img: str):
         embed = ColoredEmbed()
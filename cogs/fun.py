@@ -11,13 +11,14 @@ class Fun(commands.Cog):
     @commands.command()
     async def xkcd(self, ctx):
         """See the latest XKCD comic."""
-        async with self.bot.session.get('https://xkcd.com/info.0.json') as r:
-            if r.status == 200:
-                json = await r.json()
-                embed = ColoredEmbed(title=json['title'],
-                                     description=json['alt'])
-                embed.set_image(url=json['img'])
-                await ctx.send(embed=embed)
+        # A new comic only comes out three times a week
+        r = await self.bot.http_cache.get('https://xkcd.com/info.0.json', ttl=3600)
+        if r.status == 200:
+            json = r.json()
+            embed = ColoredEmbed(title=json['title'],
+                                 description=json['alt'])
+            embed.set_image(url=json['img'])
+            await ctx.send(embed=embed)
 
     @commands.command()
     async def lenny(self, ctx):
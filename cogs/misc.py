@@ -1,12 +1,16 @@
+import asyncio
 import discord
-import psutil
+import io
 import platform
-from arsenic import get_session
-from arsenic.browsers import Chrome
-from arsenic.services import Chromedriver
+import time
+from arsenic.errors import ArsenicError
 from datetime import datetime
 from discord.ext import commands
+from utils.browser import BrowserPool, BrowserPoolFullError
 from utils.messages import ColoredEmbed, MessageUtils
+from utils.metrics import RollingWindow
+from utils.process_stats import sparkline
+from utils.screenshots import ScreenshotCache
 
 
 class Misc(commands.Cog):
@@ -15,21 +19,86 @@ class Misc(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+        # Recent round trip times in seconds, kept to see which layer is
+        # slow when the bot feels slow
+        self.latency_history = {name: RollingWindow(100)
+                                for name in ('gateway', 'send', 'edit', 'database')}
+
+        config = bot.config
+        self.navigation_timeout = config.getfloat('Screenshot', 'navigation_timeout', fallback=15.0)
+        self.wait_timeout = config.getfloat('Screenshot', 'wait_timeout', fallback=30.0)
+        self.browsers = BrowserPool(
+            size=config.getint('Screenshot', 'browsers', fallback=2),
+            max_waiting=config.getint('Screenshot', 'max_waiting', fallback=10),
+            max_uses=config.getint('Screenshot', 'max_uses', fallback=50))
+        self.bot.loop.create_task(self.browsers.start())
+
+        self.screenshots = ScreenshotCache(
+            config.get('Screenshot', 'cache_dir', fallback='screenshots'),
+            memory_size=config.getint('Screenshot', 'memory_cache_size', fallback=32),
+            max_bytes=config.getint('Screenshot', 'disk_cache_mib', fallback=256) * 1024 ** 2,
+            ttl=config.getfloat('Screenshot', 'cache_ttl', fallback=3600.0),
+            max_width=config.getint('Screenshot', 'max_width', fallback=1280),
+            image_format=config.get('Screenshot', 'image_format', fallback='webp'))
+
+    def cog_unload(self):
+        self.bot.loop.create_task(self.browsers.close())
+
+    async def shutdown(self):
+        # Called by Bot.close, including when the launcher stops the
+        # process, so the browsers are not left running
+        await self.browsers.close()
+
     @commands.command()
     async def ping(self, ctx):
-        """Pong!"""
-        start = ctx.message.created_at.now()
+        """Pong! See how long the bot takes to reach Discord and the
+        database."""
+        for shard_id, latency in self.bot.latencies:
+            self.latency_history['gateway'].observe(latency)
+
+        start = time.perf_counter()
         message = await ctx.send(content=':ping_pong: Pong!')
-        end = datetime.now()
-        delta = end - start
-        time = delta.microseconds / 1000.0
-        await message.edit(content=f':ping_pong: Pong! Time: {time} ms.')
+        send = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await message.edit(content=':ping_pong: Pong! Measuring...')
+        edit = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await self.bot.database.fetchval('select 1')
+        database = time.perf_counter() - start
+
+        history = self.latency_history
+        for name, value in (('send', send), ('edit', edit), ('database', database)):
+            history[name].observe(value)
+
+        def line(name, label, value):
+            window = history[name]
+            percentiles = ' / '.join(f'{1000 * window.percentile(q):.0f}' for q in (0.5, 0.95, 0.99))
+            return f'{label:<9}{1000 * value:>8.2f} ms   p50/p95/p99 {percentiles} ms'
+
+        lines = [line('gateway', 'Gateway', self.bot.latency),
+                 line('send', 'Send', send),
+                 line('edit', 'Edit', edit),
+                 line('database', 'Database', database)]
+
+        latencies = self.bot.latencies
+        if len(latencies) > 1:
+            lines.append('')
+            lines.extend(f'Shard {shard_id:<3}{1000 * latency:>8.2f} ms'
+                         for shard_id, latency in latencies[:10])
+            if len(latencies) > 10:
+                lines.append(f'and {len(latencies) - 10} more')
+
+        await message.edit(content=':ping_pong: Pong!\n```\n' + '\n'.join(lines) + '\n```')
 
     @commands.command()
     async def botinfo(self, ctx):
         """See some information about the bot."""
         bot_user = self.bot.user
-        app = await self.bot.application_info()
+        app = await self.bot.get_app_info()
+        stats = self.bot.process_stats
+        cluster_stats = stats.cluster_stats or await self.bot.cluster_stats()
 
         uptime = MessageUtils.convert_time_delta(
             datetime.utcnow(), self.bot.startup_time)
@@ -40,27 +109,89 @@ class Misc(commands.Cog):
                               f'**Websocket Latency**: {1000 * self.bot.latency: .2f} ms',
                               f'**Uptime**: {uptime}'))
 
-        server_stats = "\n".join((f'**Servers**: {len(self.bot.guilds)}',
-                                  f'**Members**: {len(self.bot.users)}'))
-
-        cpu_usage_stat = f'{self.bot.process.cpu_percent():.2f}%'
-        ram_used = self.bot.process.memory_full_info().uss / (1024 ** 2)
-        total_ram = psutil.virtual_memory().total / (1024 ** 2)
-        ram_percentage = (ram_used / total_ram) * 100
-        ram_usage_stat = f'{ram_used:.2f} MiB ({ram_percentage:.2f}%)'
-        process_stats = "\n".join((f'**CPU Usage**: {cpu_usage_stat}',
-                                   f'**RAM Usage**: {ram_usage_stat}'))
+        server_stats = "\n".join((f'**Servers**: {cluster_stats["guilds"]}',
+                                  f'**Members**: {cluster_stats["users"]}'))
+
+        latencies = cluster_stats['latencies']
+        shard_lines = [f'**Shard {shard_id}**: {1000 * latency:.2f} ms'
+                       for shard_id, latency in list(latencies.items())[:20]]
+        if len(latencies) > 20:
+            shard_lines.append(f'and {len(latencies) - 20} more')
+        shard_stats = "\n".join((f'**Clusters**: {cluster_stats["clusters"]}',
+                                 f'**Shards**: {len(latencies)}',
+                                 *shard_lines))
+
+        latest = stats.latest
+        if latest is None:
+            process_stats = 'Still collecting stats, try again shortly.'
+        else:
+            total_ram = stats.total_memory
+            ram_used = latest.uss if latest.uss is not None else latest.rss
+            ram_usage_stat = (f'{ram_used / 1024 ** 2:.2f} MiB '
+                              f'({100 * ram_used / total_ram:.2f}%)')
+            process_stats = "\n".join((
+                f'**CPU Usage**: {latest.cpu:.2f}% ({self._averages("cpu", "{:.1f}%")})',
+                f'**RAM Usage**: {ram_usage_stat} ({self._averages("uss", "{:.0f} MiB", 1 / 1024 ** 2)})',
+                f'**Open Files**: {latest.fds}',
+                f'**Tasks**: {latest.tasks}',
+                f'**Loop Lag**: {1000 * latest.loop_lag:.2f} ms'))
 
         embed = ColoredEmbed()
         embed.set_author(name=bot_user, icon_url=bot_user.avatar_url)
         embed.add_field(name='Bot Info', value=bot_info, inline=False)
         embed.add_field(name='Server Stats', value=server_stats, inline=False)
+        embed.add_field(name='Shard Stats', value=shard_stats, inline=False)
         embed.add_field(name='Process Stats',
                         value=process_stats, inline=False)
+        embed.set_footer(text='Averages are over 1m / 15m / 1h.')
 
         await ctx.send(embed=embed)
 
+    def _averages(self, field, template, scale=1):
+        averages = (self.bot.process_stats.average(field, seconds) for seconds in (60, 900, 3600))
+        return ' / '.join('-' if average is None else template.format(scale * average)
+                          for average in averages)
+
+    @commands.group(case_insensitive=True)
+    async def stats(self, ctx):
+        """See how the bot's resource usage has changed over time."""
+        if ctx.invoked_subcommand is None:
+            return await ctx.send_help(ctx.command)
+
+    @stats.command(name='history')
+    async def stats_history(self, ctx):
+        """See the recent resource usage of the bot as sparklines."""
+        stats = self.bot.process_stats
+        samples = list(stats.samples)
+        if not samples:
+            return await ctx.send('No stats have been collected yet.')
+
+        # Samples are grouped so each line fits in the message
+        width = 60
+        step = -(-len(samples) // width)
+
+        def line(name, field, template, scale=1):
+            values = [getattr(sample, field) for sample in samples]
+            values = [value * scale for value in values if value is not None]
+            if not values:
+                return f'{name:<8} -'
+            groups = [values[i:i + step] for i in range(0, len(values), step)]
+            points = [sum(group) / len(group) for group in groups]
+            return (f'{name:<8} {sparkline(points)} '
+                    f'{template.format(min(values))} - {template.format(max(values))}')
+
+        minutes = len(samples) * stats.interval / 60
+        lines = (line('CPU', 'cpu', '{:.1f}%'),
+                 line('RSS', 'rss', '{:.0f} MiB', 1 / 1024 ** 2),
+                 line('USS', 'uss', '{:.0f} MiB', 1 / 1024 ** 2),
+                 line('Files', 'fds', '{:.0f}'),
+                 line('Tasks', 'tasks', '{:.0f}'),
+                 line('Lag', 'loop_lag', '{:.1f} ms', 1000),
+                 line('Latency', 'latency', '{:.0f} ms', 1000))
+        await ctx.send(f'Last {minutes:.0f} minutes:\n```\n' + '\n'.join(lines) + '\n```')
+
     @commands.command(aliases=['ss'])
+    @commands.max_concurrency(1, per=commands.BucketType.guild)
     async def screenshot(self, ctx, link: str):
         """Preview a web page without clicking on it.
 
@@ -72,17 +203,37 @@ class Misc(commands.Cog):
         if not link.startswith('http://') and not link.startswith('https://'):
             link = 'http://' + link
 
-        service = Chromedriver()
-        browser = Chrome(chromeOptions={
-            'args': ['--headless', '--disable-gpu', '--window-size=1920,1080']
-        })
+        try:
+            self.screenshots.key(link, self.browsers.window_size)
+        except ValueError:
+            return await ctx.send('That is not a valid link!')
+
+        screenshot = await self.screenshots.get(link, self.browsers.window_size)
+        if screenshot is None:
+            try:
+                screenshot = await self._take_screenshot(ctx, link)
+            except BrowserPoolFullError:
+                return await ctx.send('Too many screenshots are being taken right now. Try again later.')
+            except asyncio.TimeoutError:
+                return await ctx.send('That page took too long to load. Try again later.')
+            except ArsenicError:
+                return await ctx.send('That page could not be loaded.')
+
+        screenshot_file = discord.File(io.BytesIO(screenshot), f'image.{self.screenshots.image_format}')
+        await ctx.send(file=screenshot_file)
 
-        async with get_session(service, browser) as session:
-            await session.get(link)
+    async def _take_screenshot(self, ctx, link):
+        async with ctx.typing(), self.browsers.acquire(timeout=self.wait_timeout) as session:
+            await asyncio.wait_for(session.get(link), self.navigation_timeout)
             screenshot = await session.get_screenshot()
 
-        screenshot_file = discord.File(screenshot, 'image.png')
-        await ctx.send(file=screenshot_file)
+        return await self.screenshots.put(link, self.browsers.window_size, screenshot.getvalue())
+
+    @screenshot.error
+    async def screenshot_error(self, ctx, error):
+        """Error handler for screenshots."""
+        if isinstance(error, commands.MaxConcurrencyReached):
+            await ctx.send('A screenshot is already being taken in this server. Try again in a moment.')
 
 
 def setup(bot):
@@ -1,7 +1,14 @@
 import asyncio
+import io
 import shlex
 import subprocess
+import threading
+import tracemalloc
+import discord
 from discord.ext import commands
+from utils.memory import deep_sizeof, format_size
+from utils.messages import MessageUtils
+from utils.profiler import SamplingProfiler
 
 
 class Owner(commands.Cog):
@@ -9,6 +16,7 @@ class Owner(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.snapshots = {}
 
     async def cog_check(self, ctx):
         return await self.bot.is_owner(ctx.author)
@@ -88,6 +96,285 @@ class Owner(commands.Cog):
 
         await ctx.send(f'```{result}```')
 
+    @commands.command(name='cachestats')
+    async def cache_stats(self, ctx):
+        """See the hit, miss, and eviction counters of the caches."""
+        caches = {}
+
+        tag_cog = self.bot.get_cog('Tag')
+        if tag_cog:
+            caches['Tags'] = tag_cog.cache
+            caches['Tag suggestions'] = tag_cog.suggestions
+
+        misc_cog = self.bot.get_cog('Misc')
+        if misc_cog:
+            caches['Screenshots'] = misc_cog.screenshots.memory
+
+        if self.bot.http_cache is not None:
+            caches['HTTP'] = self.bot.http_cache
+
+        if not caches:
+            return await ctx.send('No caches are currently loaded.')
+
+        lines = []
+        for name, cache in caches.items():
+            stats = cache.stats()
+            lines.append(f'{name}: {stats["size"]}/{stats["max_size"]} entries, '
+                         f'{stats["hits"]} hits, {stats["misses"]} misses '
+                         f'({100 * stats["hit_rate"]:.2f}% hit rate), '
+                         f'{stats["evictions"]} evictions, '
+                         f'{stats["expirations"]} expirations')
+
+        await ctx.send('```{}```'.format('\n'.join(lines)))
+
+    @commands.command()
+    async def startup(self, ctx):
+        """See how long each phase of starting the bot took."""
+        timings = self.bot.startup_timings
+        if not timings:
+            return await ctx.send('No startup timings have been recorded.')
+
+        width = max(len(phase) for phase in timings)
+        lines = [f'{phase:<{width}}  {1000 * seconds:8.1f} ms' for phase, seconds in timings.items()]
+        await ctx.send('```{}```'.format('\n'.join(lines)))
+
+    @commands.command(name='querystats')
+    async def query_stats(self, ctx, limit: int = 10):
+        """See the database statements that have taken the most time.
+
+        Args
+        ----
+        limit:
+            the number of statements to show
+        """
+        database = self.bot.database
+        pool = database.pool_stats()
+
+        lines = [f'Pool: {pool["in_use"]} in use, size {pool["min_size"]}-{pool["max_size"]}, '
+                 f'statement cache {pool["statement_cache_size"]}, '
+                 f'command timeout {pool["command_timeout"]}',
+                 f'Acquire wait: {pool["acquires"]} acquires, '
+                 f'mean {1000 * pool["acquire_wait_mean"]:.2f} ms, '
+                 f'p99 {1000 * pool["acquire_wait_p99"]:.2f} ms, '
+                 f'max {1000 * pool["acquire_wait_max"]:.2f} ms',
+                 '']
+
+        for query, stats in database.slowest(limit):
+            latency = stats.latency
+            query = ' '.join(query.split())
+            if len(query) > 100:
+                query = query[:99] + '…'
+            lines.append(f'{query}\n    {latency.count} calls, {stats.errors} errors, '
+                         f'total {1000 * latency.sum:.0f} ms, mean {1000 * latency.mean:.2f} ms, '
+                         f'p95 {1000 * latency.quantile(0.95):.2f} ms, max {1000 * latency.max:.2f} ms')
+
+        result = '\n'.join(lines)
+        if len(result) > 1990:
+            result = result[:1989] + '…'
+        await ctx.send(f'```{result}```')
+
+    @commands.command(name='lagreports')
+    async def lag_reports(self, ctx, count: int = 1):
+        """See what the event loop was running the last times it was
+        blocked.
+
+        Args
+        ----
+        count:
+            the number of reports to show
+        """
+        watchdog = self.bot.watchdog
+        reports = list(watchdog.reports)[-count:]
+
+        await ctx.send(f'Current loop lag: {1000 * watchdog.lag:.2f} ms, '
+                       f'p99: {1000 * watchdog.lag_histogram.quantile(0.99):.2f} ms, '
+                       f'blocked {watchdog.blocked_count} times.')
+
+        for report in reports:
+            time = MessageUtils.stringify_datetime(report.time)
+            stack = report.stack
+            if len(stack) > 1800:
+                stack = '…' + stack[-1799:]
+            await ctx.send(f'Blocked for {1000 * report.duration:.0f} ms on {time}:\n```{stack}```')
+
+    @commands.command()
+    async def profile(self, ctx, seconds: float = 10.0, limit: int = 15):
+        """Profile the bot while it keeps running.
+
+        The event loop's stack is sampled every 5 ms. The functions that
+        took the most time are listed, and the samples are attached in
+        the collapsed stack format for making flame graphs.
+
+        Args
+        ----
+        seconds:
+            how long to profile for, up to 300 seconds
+        limit:
+            the number of functions to list
+        """
+        if not 0 < seconds <= 300:
+            return await ctx.send('You can only profile for up to 300 seconds.')
+
+        await ctx.message.add_reaction('⏳')
+
+        profiler = SamplingProfiler(threading.get_ident())
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+
+        if not profiler.samples:
+            return await ctx.send('No samples were taken.')
+
+        samples = profiler.samples
+        # The table shows shares of the time the loop was busy
+        busy = samples - profiler.idle_samples
+        lines = [f'{samples} samples over {seconds:g} seconds, '
+                 f'{100 * profiler.idle_samples / samples:.1f}% idle', '',
+                 f'{"self":>7} {"cumul":>7}  function']
+        for function, own, cumulative in profiler.top(limit):
+            if len(function) > 80:
+                function = '…' + function[-79:]
+            lines.append(f'{100 * own / busy:6.1f}% {100 * cumulative / busy:6.1f}%  {function}')
+
+        table = '\n'.join(lines)
+        if len(table) > 1990:
+            table = table[:1989] + '…'
+
+        stacks = io.BytesIO(profiler.collapsed_stacks().encode('utf-8'))
+        await ctx.send(f'```{table}```', file=discord.File(stacks, 'profile.collapsed'))
+
+    @commands.group(case_insensitive=True)
+    async def memory(self, ctx):
+        """Track down where memory is being used."""
+        if ctx.invoked_subcommand is None:
+            return await ctx.send_help(ctx.command)
+
+    @memory.command(name='start')
+    async def memory_start(self, ctx, frames: int = 1):
+        """Start tracing memory allocations.
+
+        Tracing slows the bot down, so it should be stopped once you
+        are done.
+
+        Args
+        ----
+        frames:
+            the number of stack frames to record for each allocation
+        """
+        if tracemalloc.is_tracing():
+            return await ctx.send('Memory allocations are already being traced.')
+
+        tracemalloc.start(frames)
+        await ctx.message.add_reaction('✅')
+
+    @memory.command(name='stop')
+    async def memory_stop(self, ctx):
+        """Stop tracing memory allocations and discard all snapshots."""
+        tracemalloc.stop()
+        self.snapshots.clear()
+        await ctx.message.add_reaction('✅')
+
+    @memory.command(name='snapshot')
+    async def memory_snapshot(self, ctx, name):
+        """Take a snapshot of the traced memory allocations.
+
+        Args
+        ----
+        name:
+            the name to save the snapshot as
+        """
+        if not tracemalloc.is_tracing():
+            return await ctx.send('Memory allocations are not being traced. Use `memory start` first.')
+
+        snapshot = await self.bot.loop.run_in_executor(None, self._take_snapshot)
+        self.snapshots[name] = snapshot
+
+        traced, peak = tracemalloc.get_traced_memory()
+        await ctx.send(f'Saved snapshot `{name}`. Traced memory: {format_size(traced)} '
+                       f'(peak {format_size(peak)}).')
+
+    def _take_snapshot(self):
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        ))
+
+    @memory.command(name='diff')
+    async def memory_diff(self, ctx, old, new, limit: int = 10):
+        """Show the lines that allocated the most memory between two
+        snapshots.
+
+        Args
+        ----
+        old:
+            the name of the earlier snapshot
+        new:
+            the name of the later snapshot
+        limit:
+            the number of lines to show
+        """
+        if old not in self.snapshots or new not in self.snapshots:
+            names = ', '.join(f'`{name}`' for name in self.snapshots) or 'none'
+            return await ctx.send(f'Unknown snapshot. Saved snapshots: {names}')
+
+        stats = await self.bot.loop.run_in_executor(
+            None, self.snapshots[new].compare_to, self.snapshots[old], 'lineno')
+
+        lines = []
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]
+            lines.append(f'{format_size(stat.size_diff):>11} {stat.count_diff:+8} blocks  '
+                         f'{frame.filename}:{frame.lineno}')
+
+        total = sum(stat.size_diff for stat in stats)
+        diff = '\n'.join([f'Total: {format_size(total)}', *lines])
+        if len(diff) > 1990:
+            diff = diff[:1989] + '…'
+        await ctx.send(f'```{diff}```')
+        await ctx.invoke(self.memory_structures)
+
+    @memory.command(name='structures')
+    async def memory_structures(self, ctx):
+        """Show the sizes of the bot's own caches and queues."""
+        # Measured on the event loop, since the structures could change
+        # while being measured from another thread
+        sizes = self._structure_sizes()
+
+        width = max(len(name) for name, _ in sizes)
+        lines = [f'{name:<{width}}  {description}' for name, description in sizes]
+        await ctx.send('```{}```'.format('\n'.join(lines)))
+
+    def _structure_sizes(self):
+        bot = self.bot
+        sizes = [('Prefixes', f'{len(bot.prefixes)} guilds, {format_size(deep_sizeof(bot.prefixes))}'),
+                 ('Prefix matchers', f'{len(bot.prefix_matchers)} guilds, '
+                                     f'{format_size(deep_sizeof(bot.prefix_matchers))}')]
+
+        tag_cog = bot.get_cog('Tag')
+        if tag_cog:
+            sizes.append(('Tag cache', f'{len(tag_cog.cache)} entries, '
+                                       f'{format_size(deep_sizeof(tag_cog.cache))}'))
+            sizes.append(('Tag usage buffer', f'{len(tag_cog.usage)} tags'))
+
+        if hasattr(bot, 'lavalink'):
+            players = list(bot.lavalink.players)
+            tracks = sum(len(player.queue) for _, player in players)
+            queue_size = sum(deep_sizeof(player.queue) for _, player in players)
+            sizes.append(('Player queues', f'{len(players)} players, {tracks} tracks, '
+                                           f'{format_size(queue_size)}'))
+
+        member_counts = sorted(((len(guild.members), guild.name) for guild in bot.guilds), reverse=True)
+        sizes.append(('Member cache', f'{sum(count for count, _ in member_counts)} members '
+                                      f'in {len(bot.guilds)} guilds, {len(bot.users)} users'))
+        for count, name in member_counts[:5]:
+            sizes.append((f'  {name[:20]}', f'{count} members'))
+
+        return sizes
+
     @reload.error
     @load.error
     @unload.error
@@ -1,6 +1,7 @@
-from collections import Counter
 from discord.ext import commands
 from utils.converters import InsensitiveMemberConverter
+from utils.guild_stats import GuildStatsTracker
+from utils.member_index import MemberNameIndex
 from utils.messages import ColoredEmbed, MessageUtils
 
 
@@ -9,29 +10,71 @@ class Server(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.guild_stats = GuildStatsTracker()
+        self.bot.member_index = MemberNameIndex()
+
+    def cog_unload(self):
+        # The index is only kept up to date by this cog's listeners
+        del self.bot.member_index
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self.guild_stats.member_join(member)
+        self.bot.member_index.member_join(member)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.guild_stats.member_remove(member)
+        self.bot.member_index.member_remove(member)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        self.guild_stats.member_update(before, after)
+        self.bot.member_index.member_update(after)
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before, after):
+        if before.name != after.name:
+            self.bot.member_index.user_update(self.bot, after)
+
+    @commands.Cog.listener()
+    async def on_guild_role_create(self, role):
+        self.guild_stats.roles_changed(role.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.guild_stats.roles_changed(role.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        self.guild_stats.roles_changed(after.guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.guild_stats.remove_guild(guild)
+        self.bot.member_index.remove_guild(guild)
 
     @commands.command()
     @commands.guild_only()
     async def serverinfo(self, ctx):
         """Get information about the server."""
         guild = ctx.guild
+        stats = self.guild_stats.get(guild)
 
         create_time = MessageUtils.stringify_datetime(guild.created_at)
-        roles = ', '.join(
-            [role.name for role in guild.roles if role.name != '@everyone'])
+        roles = stats.roles
         guild_info = '\n'.join((f'**ID**: {guild.id}',
                                 f'**Owner**: {guild.owner}',
                                 f'**Region**: {guild.region}',
                                 f'**Created On**: {create_time}',
                                 f'**Roles**: {roles}'))
 
-        members = guild.members
-        member_counts = Counter(map(lambda m: m.status.name, members))
+        member_counts = stats.status_counts
         member_stats = '\n'.join((f'**Online**: {member_counts["online"]}',
                                   f'**Idle**: {member_counts["idle"]}',
                                   f'**Do Not Disturb**: {member_counts["dnd"]}',
                                   f'**Offline**: {member_counts["offline"]}',
-                                  f'**Total**: {len(members)}'))
+                                  f'**Total**: {stats.total}'))
 
         text_channels = len(guild.text_channels)
         voice_channels = len(guild.voice_channels)
@@ -129,10 +172,14 @@ class Server(commands.Cog):
         prefixes: str[]
             the updated list of prefixes
         """
-        query = "update prefixes set prefixes = $1 where guild_id = $2;"
-        await self.bot.database.execute(query, prefixes, guild_id)
-
-        self.bot.prefixes[guild_id] = prefixes
+        query = '''with updated as (
+                       update prefixes set prefixes = $1 where guild_id = $2 returning 1
+                   )
+                   select pg_notify($3, $4) from updated;'''
+        await self.bot.database.execute(query, prefixes, guild_id,
+                                        *self.bot.invalidation.notification('prefixes', guild_id))
+
+        self.bot.set_prefixes(guild_id, prefixes)
 
     @commands.has_permissions(manage_guild=True)
     @prefix.command(name='add')
@@ -1,5 +1,15 @@
-from discord.ext import commands
-from utils.messages import ColoredEmbed
+import csv
+import io
+import discord
+from datetime import datetime
+from discord.ext import commands, tasks
+from utils.cache import LRUCache
+from utils.messages import ColoredEmbed, MessageUtils
+from utils.paginator import KeysetPaginator
+from utils.templates import Template
+
+# Tags can mention users, but never everyone or a role
+TAG_MENTIONS = discord.AllowedMentions(everyone=False, roles=False, users=True)
 
 
 class TagConverter(commands.clean_content):
@@ -17,32 +27,216 @@ class TagConverter(commands.clean_content):
         return result
 
 
+class CachedTag:
+    """A tag record kept in the cache together with its content
+    compiled into a template, so that the content is only parsed when
+    the tag is loaded or changed."""
+    __slots__ = ('record', 'template')
+
+    def __init__(self, record):
+        self.record = record
+        self.template = Template(record['content'])
+
+    def render(self, ctx, args):
+        """Fill in the variables of the tag for a command.
+
+        The invoker's name and arguments are escaped, so they cannot
+        make the bot mention everyone or a role.
+        """
+        return self.template.render(user=discord.utils.escape_mentions(ctx.author.display_name),
+                                    server=ctx.guild.name,
+                                    channel=ctx.channel.mention,
+                                    args=discord.utils.escape_mentions(args.strip(' ')))
+
+
 class Tag(commands.Cog):
     """Tag something for future reference."""
 
     def __init__(self, bot):
         self.bot = bot
 
+        config = bot.config
+        self.cache = LRUCache(
+            max_size=config.getint('Tags', 'cache_size', fallback=4096),
+            ttl=config.getfloat('Tags', 'cache_ttl', fallback=300.0))
+        # (guild id, name) -> the names suggested for a missing tag, which
+        # are dropped for the whole guild when a tag is added or removed
+        self.suggestions = LRUCache(
+            max_size=config.getint('Tags', 'suggestion_cache_size', fallback=1024),
+            ttl=self.cache.ttl)
+
+        # Tag id -> [uses, last used time] that have not been written
+        # to the database yet
+        self.usage = {}
+        self.flush_usage_task.start()
+
+        bot.invalidation.subscribe('tag', self.invalidate_tag)
+
+    def invalidate_tag(self, guild_id, tag):
+        """Drop a tag that was changed by another process from the
+        cache. All tags of the guild are dropped if no tag is given,
+        and every tag is dropped if no guild is given either."""
+        if guild_id is None:
+            self.cache.clear()
+            self.suggestions.clear()
+        elif tag is None:
+            self.cache.invalidate_where(lambda key: key[0] == guild_id)
+            self.invalidate_suggestions(guild_id)
+        else:
+            self.cache.invalidate((guild_id, tag))
+            self.invalidate_suggestions(guild_id)
+
+    def invalidate_suggestions(self, guild_id):
+        self.suggestions.invalidate_where(lambda key: key[0] == guild_id)
+
+    def record_usage(self, tag_id):
+        """Count a use of a tag in memory. The counts are written to the
+        database in batches by ``flush_usage``."""
+        usage = self.usage.get(tag_id)
+        if usage is None:
+            self.usage[tag_id] = [1, datetime.utcnow()]
+        else:
+            usage[0] += 1
+            usage[1] = datetime.utcnow()
+
+    async def flush_usage(self):
+        """Write the buffered tag usage counts to the database in a
+        single statement."""
+        if not self.usage:
+            return
+
+        usage, self.usage = self.usage, {}
+        tag_ids = list(usage)
+        uses = [usage[tag_id][0] for tag_id in tag_ids]
+        last_used = [usage[tag_id][1] for tag_id in tag_ids]
+
+        query = '''update tags set uses = tags.uses + u.uses,
+                                   last_used = greatest(tags.last_used, u.last_used)
+                   from unnest($1::integer[], $2::integer[], $3::timestamp[]) as u(id, uses, last_used)
+                   where tags.id = u.id;'''
+        try:
+            await self.bot.database.execute(query, tag_ids, uses, last_used)
+        except BaseException:
+            # Put the counts back so they are retried on the next flush,
+            # including when the flush is cancelled
+            for tag_id, (count, time) in usage.items():
+                pending = self.usage.setdefault(tag_id, [0, time])
+                pending[0] += count
+                pending[1] = max(pending[1], time)
+            raise
+
+    @tasks.loop(seconds=30)
+    async def flush_usage_task(self):
+        try:
+            await self.flush_usage()
+        except Exception as e:
+            print(f'Failed to flush tag usage: {e}')
+
+    @flush_usage_task.before_loop
+    async def before_flush_usage_task(self):
+        await self.bot.wait_until_ready()
+
+    def cog_unload(self):
+        self.bot.invalidation.unsubscribe('tag', self.invalidate_tag)
+        # stop lets a flush that is in progress finish, where cancel
+        # would interrupt it
+        self.flush_usage_task.stop()
+        self.bot.loop.create_task(self.flush_usage())
+
+    async def shutdown(self):
+        self.flush_usage_task.stop()
+        await self.flush_usage()
+
     async def search_tag(self, tag, guild_id):
-        query = 'select * from tags where name = $1 and guild_id = $2;'
-        return await self.bot.database.fetchrow(query, tag, guild_id)
+        """Find a tag in a guild, using the cache when possible.
+
+        Tags that do not exist are cached as well, so repeated lookups
+        of a missing tag do not reach the database either.
+
+        Returns
+        -------
+        the cached tag, or None if the tag does not exist
+        """
+        key = (guild_id, tag)
+        result = self.cache.get(key)
+        if result is not LRUCache.MISSING:
+            return result
+
+        # A write or invalidation of the tag while it is being read
+        # stops the older result from being cached
+        token = self.cache.begin_load(key)
+        result = LRUCache.MISSING
+        try:
+            query = 'select id, name, owner, guild_id, content from tags where name = $1 and guild_id = $2;'
+            record = await self.bot.database.fetchrow(query, tag, guild_id)
+            result = CachedTag(record) if record else None
+        finally:
+            self.cache.finish_load(key, token, result)
+        return result
+
+    async def similar_tags(self, tag, guild_id, limit=5):
+        """Find the names of the tags in a guild that are the most
+        similar to a name, ranked by trigram similarity.
+
+        The suggestions are cached along with the missing tag, so
+        repeated lookups of a missing tag do not reach the database.
+
+        Returns
+        -------
+        a list of at most ``limit`` tag names
+        """
+        key = (guild_id, tag)
+        names = self.suggestions.get(key)
+        if names is not LRUCache.MISSING:
+            return names[:limit]
+
+        token = self.suggestions.begin_load(key)
+        names = LRUCache.MISSING
+        try:
+            query = '''select name from tags where guild_id = $1 and name % $2
+                       order by similarity(name, $2) desc, name limit $3;'''
+            records = await self.bot.database.fetch(query, guild_id, tag, limit)
+            names = [record['name'] for record in records]
+        finally:
+            self.suggestions.finish_load(key, token, names)
+        return names
 
     @commands.group(invoke_without_command=True, case_insensitive=True)
-    async def tag(self, ctx, *, tag: TagConverter = None):
+    async def tag(self, ctx, *, tag: str = None):
         """Search, create, edit, or remove a tag.
 
         If no command is specified, the tag will be searched for.
+
+        Tags can contain the variables {user}, {server}, {channel}, and
+        {args}. Anything written after the first word of a one word tag
+        is used as {args}.
         """
         if tag is None:
             return await ctx.send_help(ctx.command)
         if ctx.invoked_subcommand is None:
-            result = await self.search_tag(tag, ctx.guild.id)
+            guild_id = ctx.guild.id
+            name = await TagConverter().convert(ctx, tag)
+            args = ''
+            result = await self.search_tag(name, guild_id)
+
+            if result is None and ' ' in name:
+                first_word, args = tag.strip(' ').split(' ', 1)
+                first_word = first_word.lower()
+                result = await self.search_tag(first_word, guild_id)
+                if result:
+                    name = first_word
 
             if result:
-                content = result['content']
-                await ctx.send(f'**{tag}**\n{content}')
+                self.record_usage(result.record['id'])
+                content = result.render(ctx, args)
+                await ctx.send(f'**{name}**\n{content}', allowed_mentions=TAG_MENTIONS)
             else:
-                await ctx.send('No tag exists with that name!')
+                suggestions = await self.similar_tags(name, guild_id)
+                if suggestions:
+                    names = '\n'.join(f'**∙** {suggestion}' for suggestion in suggestions)
+                    await ctx.send(f'No tag exists with that name! Did you mean:\n{names}')
+                else:
+                    await ctx.send('No tag exists with that name!')
 
     @tag.command(name='create')
     async def create_tag(self, ctx, tag: TagConverter = None, *, content=None):
@@ -62,18 +256,27 @@ class Tag(commands.Cog):
         """
         if not tag:
             return await ctx.send('You must enter a tag to create!')
-        if tag in ['create', 'remove', 'delete', 'edit', 'list', 'owned']:
+        if tag in self.tag.all_commands:
             return await ctx.send('You cannot create a tag with that name!')
 
         guild_id = ctx.guild.id
-        result = await self.search_tag(tag, guild_id)
-
-        if result is None:
-            query = 'insert into tags(name, owner, guild_id, content) values($1, $2, $3, $4);'
-            await self.bot.database.execute(query, tag, ctx.author.id, guild_id, content)
-
+        key = (guild_id, tag)
+
+        query = '''with inserted as (
+                       insert into tags(name, owner, guild_id, content) values($1, $2, $3, $4)
+                       on conflict (guild_id, name) do nothing
+                       returning id, name, owner, guild_id, content
+                   )
+                   select *, pg_notify($5, $6) from inserted;'''
+        record = await self.bot.database.fetchrow(query, tag, ctx.author.id, guild_id, content,
+                                                  *self.bot.invalidation.notification('tag', guild_id, tag))
+
+        if record:
+            self.cache.set(key, CachedTag(record))
+            self.invalidate_suggestions(guild_id)
             await ctx.send(f'The tag **{tag}** has successfully been created!')
         else:
+            self.cache.invalidate(key)
             await ctx.send('That tag already exists!')
 
     @tag.command(name='edit')
@@ -90,22 +293,29 @@ class Tag(commands.Cog):
         content:
             the new content
         """
-        result = await self.search_tag(tag, ctx.guild.id)
-
-        if result:
-            owner_id = ctx.author.id
-
-            if result['owner'] == owner_id:
-                tag_id = result['id']
+        guild_id = ctx.guild.id
 
-                query = "update tags set content = $1 where id = $2;"
-                await self.bot.database.execute(query, content, tag_id)
+        query = '''with target as (
+                       select id, owner from tags where guild_id = $2 and name = $3
+                   ), updated as (
+                       update tags set content = $1 from target
+                       where tags.id = target.id and target.owner = $4
+                       returning tags.id
+                   )
+                   select target.owner, updated.id,
+                          case when updated.id is not null then pg_notify($5, $6) end
+                   from target left join updated on updated.id = target.id;'''
+        result = await self.bot.database.fetchrow(query, content, guild_id, tag, ctx.author.id,
+                                                  *self.bot.invalidation.notification('tag', guild_id, tag))
 
-                await ctx.send('Your tag has been successfully edited!')
-            else:
-                await ctx.send('You cannot edit a tag that you do not own!')
-        else:
+        if result is None:
+            self.cache.set((guild_id, tag), None)
             await ctx.send('There is no tag with that name!')
+        elif result['id'] is None:
+            await ctx.send('You cannot edit a tag that you do not own!')
+        else:
+            self.cache.invalidate((guild_id, tag))
+            await ctx.send('Your tag has been successfully edited!')
 
     @tag.command(name='remove', aliases=['delete'])
     async def remove_tag(self, ctx, *, tag: TagConverter = None):
@@ -116,71 +326,278 @@ class Tag(commands.Cog):
         tag:
             the tag to remove
         """
-        result = await self.search_tag(tag, ctx.guild.id)
-
-        if result:
-            owner_id = ctx.author.id
-
-            if result['owner'] == owner_id:
-                tag_id = result['id']
+        guild_id = ctx.guild.id
 
-                query = "delete from tags where id = $1;"
-                await self.bot.database.execute(query, tag_id)
+        query = '''with target as (
+                       select id, owner from tags where guild_id = $1 and name = $2
+                   ), deleted as (
+                       delete from tags using target
+                       where tags.id = target.id and target.owner = $3
+                       returning tags.id
+                   )
+                   select target.owner, deleted.id,
+                          case when deleted.id is not null then pg_notify($4, $5) end
+                   from target left join deleted on deleted.id = target.id;'''
+        result = await self.bot.database.fetchrow(query, guild_id, tag, ctx.author.id,
+                                                  *self.bot.invalidation.notification('tag', guild_id, tag))
 
-                await ctx.send('Your tag has been successfully removed!')
-            else:
-                await ctx.send('You remove a tag that you do not own!')
-        else:
+        if result is None:
+            self.cache.set((guild_id, tag), None)
             await ctx.send('There is no tag with that name!')
+        elif result['id'] is None:
+            await ctx.send('You remove a tag that you do not own!')
+        else:
+            self.cache.set((guild_id, tag), None)
+            self.invalidate_suggestions(guild_id)
+            await ctx.send('Your tag has been successfully removed!')
 
-    def bulletize_tags(self, record_result):
-        """Format the tags from the resulting database query into a
-        string.
-
-        Args
-        ----
-        record_result:
-            the result from the database query
+    def bulletize_tag(self, name):
+        """Format a tag name as a line in a list of tags.
 
-        Returns
-        -------
-        a string containing the list of tags that start with bullet
-        points and are separated by new lines
+        Names that are too long are shortened so that a full page of
+        tags always fits in an embed.
         """
-        bulletized = ''
-        for record in record_result:
-            bulletized += f'**∙** {record["name"]}\n'
-        return bulletized
+        if len(name) > 90:
+            name = name[:89] + '…'
+        return f'**∙** {name}'
 
     @tag.command(name='list')
     async def list_tags(self, ctx):
         """List all tags that are saved in this server. """
-        query = "select name from tags where guild_id = $1 order by name;"
-        result = await self.bot.database.fetch(query, ctx.guild.id)
+        guild_id = ctx.guild.id
 
-        if result:
-            tags = self.bulletize_tags(result)
+        query = 'select count(*) from tags where guild_id = $1;'
+        total = await self.bot.database.fetchval(query, guild_id)
 
-            embed = ColoredEmbed()
-            embed.add_field(name='Tags List', value=tags)
-            await ctx.send(embed=embed)
-        else:
-            await ctx.send('No tags have been created in this server!')
+        if not total:
+            return await ctx.send('No tags have been created in this server!')
+
+        async def fetch_page(after, limit):
+            query = 'select name from tags where guild_id = $1 and name > $2 order by name limit $3;'
+            records = await self.bot.database.fetch(query, guild_id, after, limit)
+            return [record['name'] for record in records]
+
+        paginator = KeysetPaginator(ctx, 'Tags List', fetch_page, total,
+                                    format_key=self.bulletize_tag)
+        await paginator.start()
 
     @tag.command(name='owned')
     async def owned_tags(self, ctx):
         """List all tags you own in this server."""
-        query = "select name from tags where owner = $1 and guild_id = $2 order by name;"
-        result = await self.bot.database.fetch(query, ctx.author.id, ctx.guild.id)
+        guild_id = ctx.guild.id
+        owner_id = ctx.author.id
 
-        if result:
-            tags = self.bulletize_tags(result)
+        query = 'select count(*) from tags where guild_id = $1 and owner = $2;'
+        total = await self.bot.database.fetchval(query, guild_id, owner_id)
 
-            embed = ColoredEmbed()
-            embed.add_field(name=f'Tags Owned by {ctx.author}', value=tags)
-            await ctx.send(embed=embed)
-        else:
-            await ctx.send('You don\'t own any tags in this server!')
+        if not total:
+            return await ctx.send('You don\'t own any tags in this server!')
+
+        async def fetch_page(after, limit):
+            query = '''select name from tags where guild_id = $1 and owner = $2 and name > $3
+                       order by name limit $4;'''
+            records = await self.bot.database.fetch(query, guild_id, owner_id, after, limit)
+            return [record['name'] for record in records]
+
+        paginator = KeysetPaginator(ctx, f'Tags Owned by {ctx.author}', fetch_page, total,
+                                    format_key=self.bulletize_tag)
+        await paginator.start()
+
+    @tag.command(name='search')
+    async def search_tags(self, ctx, *, words):
+        """Search for tags by their names and contents.
+
+        The tags that are the most relevant to the words you enter are
+        shown first.
+
+        Args
+        ----
+        words:
+            the words to search for
+        """
+        query = '''select name, content from tags, plainto_tsquery('pg_catalog.english', $2) query
+                   where guild_id = $1 and search @@ query
+                   order by ts_rank(search, query) desc, name limit $3;'''
+        result = await self.bot.database.fetch(query, ctx.guild.id, words, 10)
+
+        if not result:
+            return await ctx.send('No tags matched your search!')
+
+        lines = []
+        for record in result:
+            content = ' '.join((record['content'] or '').split())
+            if len(content) > 80:
+                content = content[:79] + '…'
+            lines.append(f'{self.bulletize_tag(record["name"])}\n{content}')
+
+        embed = ColoredEmbed(title='Search Results', description='\n'.join(lines))
+        await ctx.send(embed=embed)
+
+    @tag.command(name='stats')
+    async def tag_stats(self, ctx, *, tag: TagConverter = None):
+        """See how often a tag has been used.
+
+        Args
+        ----
+        tag:
+            the tag to see the statistics of
+        """
+        if not tag:
+            return await ctx.send('You must enter a tag to see the statistics of!')
+
+        query = 'select id, owner, uses, last_used from tags where guild_id = $1 and name = $2;'
+        result = await self.bot.database.fetchrow(query, ctx.guild.id, tag)
+
+        if result is None:
+            return await ctx.send('There is no tag with that name!')
+
+        uses = result['uses']
+        last_used = result['last_used']
+
+        pending = self.usage.get(result['id'])
+        if pending:
+            uses += pending[0]
+            last_used = pending[1]
+
+        owner = self.bot.get_user(result['owner']) or result['owner']
+        last_used = MessageUtils.stringify_datetime(last_used) if last_used else 'Never'
+        tag_info = '\n'.join((f'**Owner**: {owner}',
+                              f'**Uses**: {uses}',
+                              f'**Last Used**: {last_used}'))
+
+        embed = ColoredEmbed(title=tag)
+        embed.add_field(name='Tag Stats', value=tag_info, inline=False)
+        await ctx.send(embed=embed)
+
+    @tag.command(name='top')
+    async def top_tags(self, ctx):
+        """List the most used tags in this server."""
+        query = '''select name, uses from tags where guild_id = $1 and uses > 0
+                   order by uses desc, name limit $2;'''
+        result = await self.bot.database.fetch(query, ctx.guild.id, 10)
+
+        if not result:
+            return await ctx.send('No tags have been used in this server yet!')
+
+        lines = '\n'.join(f'{self.bulletize_tag(record["name"])} ({record["uses"]} uses)'
+                          for record in result)
+
+        embed = ColoredEmbed(title='Top Tags', description=lines)
+        await ctx.send(embed=embed)
+
+    @tag.command(name='export')
+    @commands.check_any(commands.is_owner(), commands.has_permissions(manage_guild=True))
+    async def export_tags(self, ctx):
+        """Export all tags in this server to a CSV file.
+
+        The file can be imported into another server with `tag import`.
+
+        Required Permissions
+        --------------------
+        Manage Guild
+        """
+        output = io.BytesIO()
+        query = 'select name, owner, content from tags where guild_id = $1 order by name'
+
+        async with self.bot.database.acquire() as connection:
+            await connection.copy_from_query(query, ctx.guild.id, output=output,
+                                             format='csv', header=True)
+
+        output.seek(0)
+        await ctx.send(file=discord.File(output, f'tags-{ctx.guild.id}.csv'))
+
+    def _parse_import(self, data, guild_id, default_owner):
+        """Read the tags to import from a CSV file.
+
+        Names are normalized the same way as in `tag create`, and rows
+        with an empty or reserved name, or a name that appears earlier
+        in the file, are skipped.
+
+        Returns
+        -------
+        a list of (name, owner, guild_id, content) tuples, and the
+        number of rows that were skipped
+        """
+        reader = csv.DictReader(io.StringIO(data.decode('utf-8-sig')))
+        if not reader.fieldnames or 'name' not in reader.fieldnames:
+            raise ValueError('The file must be a CSV file with a `name` column.')
+
+        records = []
+        names = set()
+        skipped = 0
+        for row in reader:
+            name = (row.get('name') or '').strip(' ').lower()
+            if not name or name in names or name in self.tag.all_commands:
+                skipped += 1
+                continue
+
+            try:
+                owner = int(row.get('owner'))
+            except (TypeError, ValueError):
+                owner = default_owner
+
+            names.add(name)
+            records.append((name, owner, guild_id, row.get('content')))
+        return records, skipped
+
+    @tag.command(name='import')
+    @commands.check_any(commands.is_owner(), commands.has_permissions(manage_guild=True))
+    async def import_tags(self, ctx):
+        """Import tags into this server from an attached CSV file.
+
+        The file needs a `name` and a `content` column, like the files
+        made by `tag export`. The owner of each tag is kept if the file
+        has an `owner` column, or set to you otherwise. Tags with the
+        same name as a tag that already exists are skipped.
+
+        Required Permissions
+        --------------------
+        Manage Guild
+        """
+        if not ctx.message.attachments:
+            return await ctx.send('You must attach a CSV file to import!')
+
+        guild_id = ctx.guild.id
+        data = await ctx.message.attachments[0].read()
+
+        try:
+            records, skipped = self._parse_import(data, guild_id, ctx.author.id)
+        except (ValueError, csv.Error) as e:
+            return await ctx.send(f'Unable to read the file: {e}')
+
+        if not records:
+            return await ctx.send('There are no tags to import in that file!')
+
+        async with self.bot.database.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute('''create temporary table tag_import(
+                                                name text, owner bigint, guild_id bigint, content text
+                                            ) on commit drop;''')
+                await connection.copy_records_to_table('tag_import', records=records)
+
+                query = '''with inserted as (
+                               insert into tags(name, owner, guild_id, content)
+                               select name, owner, guild_id, content from tag_import
+                               on conflict (guild_id, name) do nothing
+                               returning 1
+                           )
+                           select count(*), case when count(*) > 0 then pg_notify($1, $2) end from inserted;'''
+                imported = await connection.fetchval(query, *self.bot.invalidation.notification('tag', guild_id))
+
+        # Tags that were looked up before being imported are cached as
+        # missing, so the cached entries of this guild are dropped
+        self.cache.invalidate_where(lambda key: key[0] == guild_id)
+        self.invalidate_suggestions(guild_id)
+
+        skipped += len(records) - imported
+        await ctx.send(f'Imported {imported} tags! {skipped} tags were skipped.')
+
+    @export_tags.error
+    @import_tags.error
+    async def handle_missing_permissions(self, ctx, error):
+        """Error handler for tag import and export permissions."""
+        if isinstance(error, commands.CheckAnyFailure):
+            await ctx.send('You need the Manage Server permission to do that!')
 
 
 def setup(bot):
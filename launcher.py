@@ -0,0 +1,238 @@
+import asyncio
+import configparser
+import multiprocessing
+import signal
+import sys
+import time
+import aiohttp
+from utils.cluster import combine_statuses
+
+config = configparser.ConfigParser()
+config.read('config.ini')
+
+
+async def fetch_shard_count(token):
+    """Ask Discord how many shards the bot should use.
+
+    Args
+    ----
+    token: str
+        the Discord token of the bot
+    """
+    headers = {'Authorization': f'Bot {token}'}
+    async with aiohttp.ClientSession() as session:
+        async with session.get('https://discord.com/api/v7/gateway/bot', headers=headers) as r:
+            r.raise_for_status()
+            json = await r.json()
+            return json['shards']
+
+
+def split_shards(shard_count, clusters):
+    """Split the shards into contiguous ranges, one for each cluster.
+
+    Returns
+    -------
+    a list with a list of shard ids for each cluster
+    """
+    clusters = min(clusters, shard_count)
+    size, remainder = divmod(shard_count, clusters)
+
+    ranges = []
+    start = 0
+    for cluster_id in range(clusters):
+        end = start + size + (1 if cluster_id < remainder else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def run_cluster(cluster_id, shard_ids, shard_count, cluster_status):
+    """Run the bot for the shards of one cluster. This is the entry
+    point of each worker process."""
+    import main
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(main.run_bot(shard_ids=shard_ids,
+                                         shard_count=shard_count,
+                                         cluster_id=cluster_id,
+                                         cluster_status=cluster_status))
+
+
+class Cluster:
+    """A worker process that runs the bot for a range of shards."""
+
+    def __init__(self, cluster_id, shard_ids):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+
+        self.process = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.restart_at = 0.0
+
+
+class Launcher:
+    """Start a worker process for each cluster of shards, and restart
+    the workers that exit.
+
+    Workers that keep crashing are restarted with an increasing delay,
+    up to ``max_restart_delay`` seconds. Workers write their status to
+    a dict shared through a multiprocessing manager, which is used by
+    ``botinfo`` and logged by the launcher.
+
+    Args
+    ----
+    shard_count: int
+        the total number of shards
+    clusters: int
+        the number of worker processes to split the shards across
+    target: function
+        the entry point of each worker, called with the cluster id, the
+        shard ids, the shard count, and the shared status dict. Can be
+        replaced to run the workers against a fake gateway.
+    restart_delay: float
+        the number of seconds to wait before restarting a worker the
+        first time
+    max_restart_delay: float
+        the longest the launcher waits before restarting a worker
+    status_interval: float
+        the number of seconds between status logs
+    """
+
+    def __init__(self, shard_count, clusters, *, target=run_cluster, restart_delay=5.0,
+                 max_restart_delay=300.0, status_interval=60.0):
+        self.shard_count = shard_count
+        self.target = target
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.status_interval = status_interval
+
+        self.clusters = [Cluster(cluster_id, shard_ids) for cluster_id, shard_ids
+                         in enumerate(split_shards(shard_count, clusters))]
+
+        self.manager = None
+        self.status = None
+        self._running = False
+
+    def _start_cluster(self, cluster):
+        cluster.process = multiprocessing.Process(
+            target=self.target,
+            args=(cluster.cluster_id, cluster.shard_ids, self.shard_count, self.status),
+            name=f'cluster-{cluster.cluster_id}',
+            daemon=True)
+        cluster.process.start()
+        cluster.started_at = time.monotonic()
+
+        print(f'Started cluster {cluster.cluster_id} with shards '
+              f'{cluster.shard_ids[0]}-{cluster.shard_ids[-1]} (pid {cluster.process.pid}).')
+
+    def start(self):
+        self.manager = multiprocessing.Manager()
+        self.status = self.manager.dict()
+        self._running = True
+
+        for cluster in self.clusters:
+            self._start_cluster(cluster)
+
+    def check_clusters(self):
+        """Restart the clusters whose process has exited."""
+        now = time.monotonic()
+
+        for cluster in self.clusters:
+            if cluster.process.is_alive():
+                continue
+
+            if not cluster.restart_at:
+                # A cluster that ran for a while before exiting is not
+                # crash looping, so its delay starts over
+                if now - cluster.started_at > self.max_restart_delay:
+                    cluster.restarts = 0
+
+                delay = min(self.restart_delay * 2 ** cluster.restarts, self.max_restart_delay)
+                cluster.restart_at = now + delay
+                self.status.pop(cluster.cluster_id, None)
+                print(f'Cluster {cluster.cluster_id} exited with code {cluster.process.exitcode}. '
+                      f'Restarting in {delay:.0f} seconds.')
+            elif now >= cluster.restart_at:
+                cluster.restarts += 1
+                cluster.restart_at = 0.0
+                self._start_cluster(cluster)
+
+    def aggregate_status(self):
+        """
+        Returns
+        -------
+        the combined status of the clusters that are reporting
+        """
+        return combine_statuses(list(self.status.values()))
+
+    def log_status(self):
+        status = self.aggregate_status()
+        latencies = status['latencies'].values()
+        average = 1000 * sum(latencies) / len(latencies) if latencies else 0.0
+        print(f'{status["clusters"]}/{len(self.clusters)} clusters reporting, '
+              f'{status["guilds"]} guilds, {status["users"]} users, {len(latencies)}/{self.shard_count} shards, '
+              f'average latency {average:.2f} ms.')
+
+    def supervise(self, interval=1.0):
+        """Watch the clusters until the launcher is stopped."""
+        next_log = time.monotonic() + self.status_interval
+
+        while self._running:
+            self.check_clusters()
+
+            if time.monotonic() >= next_log:
+                self.log_status()
+                next_log += self.status_interval
+
+            time.sleep(interval)
+
+    def stop(self, timeout=30.0):
+        """Stop every cluster. Each worker closes the bot when it is
+        terminated, and is killed if it has not exited within the
+        timeout."""
+        self._running = False
+
+        for cluster in self.clusters:
+            if cluster.process is not None and cluster.process.is_alive():
+                cluster.process.terminate()
+
+        deadline = time.monotonic() + timeout
+        for cluster in self.clusters:
+            if cluster.process is not None:
+                cluster.process.join(max(0.0, deadline - time.monotonic()))
+                if cluster.process.is_alive():
+                    print(f'Cluster {cluster.cluster_id} did not shut down in time, killing it.')
+                    cluster.process.kill()
+                    cluster.process.join()
+
+        if self.manager is not None:
+            self.manager.shutdown()
+
+
+def main():
+    cluster_config = config['Cluster'] if config.has_section('Cluster') else {}
+    clusters = int(cluster_config.get('clusters', multiprocessing.cpu_count()))
+    shard_count = int(cluster_config.get('shards', 0))
+
+    if not shard_count:
+        shard_count = asyncio.get_event_loop().run_until_complete(
+            fetch_shard_count(config['Discord']['token']))
+
+    launcher = Launcher(shard_count, clusters)
+    launcher.start()
+
+    # Stopping the launcher stops the clusters too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        launcher.supervise()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        launcher.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,56 +1,159 @@
 import asyncio
 import configparser
+import contextlib
 import datetime
 import os
+import signal
+import time
 import aiohttp
 import asyncpg
 import discord
 import psutil
+from aiohttp import web
 from discord.ext import commands
+from discord.ext.commands.view import StringView
+from utils.cluster import combine_statuses
+from utils.database import InstrumentedPool
+from utils.http import HTTPCache
+from utils.invalidation import InvalidationBus
+from utils.metrics import Histogram, PrometheusWriter
+from utils.prefixes import PrefixMatcher
+from utils.process_stats import ProcessStatsSampler
+from utils.schema import migrate
+from utils.watchdog import LoopWatchdog
 
 config = configparser.ConfigParser()
 config.read('config.ini')
 
+DEFAULT_PREFIXES = ['-']
 
-async def run_bot():
-    bot = Bot(command_prefix=get_prefix, case_insensitive=True)
+
+async def run_bot(**kwargs):
+    """Run the bot until it is closed.
+
+    The bot is closed cleanly on SIGINT and SIGTERM, which the launcher
+    uses to stop its workers, and when it stops because of an error, so
+    the cogs always get to shut down.
+
+    Args
+    ----
+    kwargs:
+        passed on to the bot, such as the ``shard_ids`` and
+        ``shard_count`` of a cluster started by the launcher
+    """
+    bot = Bot(command_prefix=get_prefix, case_insensitive=True, **kwargs)
+
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, lambda: asyncio.ensure_future(bot.close()))
+        except NotImplementedError:
+            # Event loops on Windows do not support signal handlers
+            pass
 
     try:
         await bot.start(config['Discord']['token'])
-    except KeyboardInterrupt:
-        await bot.database.close()
-        await bot.logout()
+    finally:
+        await bot.close()
 
 
 async def get_prefix(bot, msg):
-    guild_id = msg.guild.id
-
-    if guild_id in bot.prefixes:
-        return commands.when_mentioned_or(*bot.prefixes[guild_id])(bot, msg)
+    matcher = await bot.get_prefix_matcher(msg.guild.id)
+    prefix = matcher.match(msg.content)
+    if prefix is not None:
+        return prefix
 
-    query = 'select prefixes from prefixes where guild_id = $1;'
-    prefixes = await bot.database.fetchval(query, guild_id)
-    if not prefixes:
-        prefixes = ['-']
-        query = 'insert into prefixes(guild_id, prefixes) values($1, $2);'
-        await bot.database.execute(query, guild_id, prefixes)
+    prefixes = await bot.get_guild_prefixes(msg.guild.id)
+    return commands.when_mentioned_or(*prefixes)(bot, msg)
 
-    bot.prefixes[guild_id] = prefixes
 
-    return commands.when_mentioned_or(*prefixes)(bot, msg)
+class Bot(commands.AutoShardedBot):
+    """The bot, which can run every shard in this process or only the
+    shards of one cluster when started by the launcher.
 
+    Args
+    ----
+    cluster_id: int
+        the id of the cluster this process runs, if any
+    cluster_status: dict
+        a dict shared with the launcher and the other clusters, which
+        the status of this cluster is written to
+    """
 
-class Bot(commands.Bot):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, cluster_id=None, cluster_status=None, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.session = aiohttp.ClientSession(loop=self.loop)
+        self.cluster_id = cluster_id
+        self.cluster_status = cluster_status
+        if cluster_status is not None:
+            self.loop.create_task(self._report_cluster_status())
+
+        self.session = None
+        self.http_cache = None
         self.config = config
 
         self.process = psutil.Process()
         self.startup_time = datetime.datetime.utcnow()
 
         self.prefixes = {}
+        self._prefix_loads = {}
+        self.prefix_matchers = {}
+
+        self.invalidation = InvalidationBus(self.database_credentials())
+        self.invalidation.subscribe('prefixes', self._invalidate_prefixes)
+
+        self.startup_timings = {}
+        self._setup_started = None
+
+        self.command_latency = {}
+        self.command_errors = {}
+        self._metrics_runner = None
+        self._close_task = None
+
+        watchdog_config = config['Watchdog'] if config.has_section('Watchdog') else {}
+        self.watchdog = LoopWatchdog(threshold=float(watchdog_config.get('threshold', 0.5)))
+        self.process_stats = ProcessStatsSampler(
+            self,
+            interval=config.getfloat('Stats', 'interval', fallback=10.0),
+            history=config.getint('Stats', 'history', fallback=360))
+        self.app_info = None
+        self._prefixes_loaded = False
+
+    @contextlib.contextmanager
+    def _time_phase(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[phase] = time.perf_counter() - start
+
+    async def setup(self):
+        """Prepare everything commands depend on before connecting to
+        Discord: the HTTP session, the database pool and schema, and
+        the extensions. This runs once, no matter how many times the
+        bot reconnects."""
+        self._setup_started = time.perf_counter()
+
+        with self._time_phase('session'):
+            self.session = aiohttp.ClientSession()
+            self.http_cache = HTTPCache(self.session)
+        with self._time_phase('database'):
+            await self.setup_database()
+        with self._time_phase('extensions'):
+            await self.load_extensions()
+        with self._time_phase('metrics'):
+            await self.start_metrics_server()
+        self.watchdog.start()
+        self.process_stats.start()
+
+        self.startup_timings['setup'] = time.perf_counter() - self._setup_started
+        timings = ', '.join(f'{phase} {1000 * seconds:.0f} ms'
+                            for phase, seconds in self.startup_timings.items())
+        print(f'Setup finished: {timings}.')
+
+    async def start(self, *args, **kwargs):
+        await self.setup()
+        await super().start(*args, **kwargs)
 
     async def on_ready(self):
         print(f'You are currently logged in as {self.user}.')
@@ -58,33 +161,348 @@ class Bot(commands.Bot):
         game = discord.Game('-help')
         await self.change_presence(activity=game)
 
-        self.load_extensions()
+        # on_ready is dispatched again after reconnecting, but the
+        # prefixes only need to be loaded the first time
+        if not self._prefixes_loaded:
+            with self._time_phase('prefixes'):
+                await self.load_prefixes()
+            self._prefixes_loaded = True
 
-        await self.setup_database()
+            self.startup_timings['ready'] = time.perf_counter() - self._setup_started
+            print(f'Ready {1000 * self.startup_timings["ready"]:.0f} ms after starting.')
 
-    async def setup_database(self):
+        await self.get_app_info()
+
+    async def get_app_info(self):
+        """Get the bot's application info, which is only fetched from
+        Discord the first time since it rarely changes."""
+        if self.app_info is None:
+            self.app_info = await self.application_info()
+        return self.app_info
+
+    async def on_guild_join(self, guild):
+        await self.get_guild_prefixes(guild.id)
+
+    async def on_guild_remove(self, guild):
+        self.prefixes.pop(guild.id, None)
+        self.prefix_matchers.pop(guild.id, None)
+
+    async def get_context(self, message, *, cls=commands.Context):
+        received_at = time.perf_counter()
+
+        # Most messages are not commands, so they are rejected here with
+        # the guild's prefix matcher before discord.py tries each prefix
+        if message.guild is not None:
+            matcher = await self.get_prefix_matcher(message.guild.id)
+            if matcher.match(message.content) is None:
+                view = StringView(message.content)
+                return cls(prefix=None, view=view, bot=self, message=message)
+
+        ctx = await super().get_context(message, cls=cls)
+        ctx.received_at = received_at
+        return ctx
+
+    def _observe_command(self, ctx):
+        received_at = getattr(ctx, 'received_at', None)
+        if ctx.command is None or received_at is None:
+            return
+
+        name = ctx.command.qualified_name
+        histogram = self.command_latency.get(name)
+        if histogram is None:
+            histogram = self.command_latency[name] = Histogram()
+        histogram.observe(time.perf_counter() - received_at)
+
+    async def on_command_completion(self, ctx):
+        self._observe_command(ctx)
+
+    async def on_command_error(self, ctx, error):
+        self._observe_command(ctx)
+
+        if ctx.command is not None:
+            original = getattr(error, 'original', error)
+            key = (ctx.command.qualified_name, type(original).__name__)
+            self.command_errors[key] = self.command_errors.get(key, 0) + 1
+
+        await super().on_command_error(ctx, error)
+
+    def render_metrics(self):
+        """
+        Returns
+        -------
+        the metrics of this process in the Prometheus text format
+        """
+        writer = PrometheusWriter()
+
+        for name, histogram in self.command_latency.items():
+            writer.histogram('rdbot_command_duration_seconds',
+                             'Time from receiving a command message to finishing the command.',
+                             histogram, command=name)
+        for (name, error), count in self.command_errors.items():
+            writer.counter('rdbot_command_errors_total', 'Number of commands that raised an error.',
+                           count, command=name, error=error)
+
+        for shard_id, latency in self.latencies:
+            writer.gauge('rdbot_gateway_latency_seconds', 'Gateway heartbeat latency.',
+                         latency, shard=shard_id)
+        writer.gauge('rdbot_guilds', 'Number of guilds in this process.', len(self.guilds))
+
+        writer.gauge('rdbot_event_loop_lag_seconds', 'Most recent event loop lag.', self.watchdog.lag)
+        writer.histogram('rdbot_event_loop_lag_distribution_seconds', 'Event loop lag.',
+                         self.watchdog.lag_histogram)
+        writer.counter('rdbot_event_loop_blocked_total', 'Number of times the event loop was blocked.',
+                       self.watchdog.blocked_count)
+
+        if isinstance(getattr(self, 'database', None), InstrumentedPool):
+            for query, stats in self.database.statements.items():
+                query = ' '.join(query.split())
+                writer.histogram('rdbot_query_duration_seconds', 'Database statement latency.',
+                                 stats.latency, query=query)
+                writer.counter('rdbot_query_errors_total', 'Number of failed database statements.',
+                               stats.errors, query=query)
+            writer.histogram('rdbot_pool_acquire_wait_seconds', 'Time spent waiting for a connection.',
+                             self.database.acquire_wait)
+            writer.gauge('rdbot_pool_connections_in_use', 'Database connections in use.',
+                         self.database.in_use)
+
+        return writer.render()
+
+    async def start_metrics_server(self):
+        """Serve the metrics at /metrics over HTTP.
+
+        Each cluster listens on the configured port plus its cluster id,
+        so several clusters can run on the same host. If the port is
+        already in use, such as by another bot process on the same
+        host, the bot starts without the endpoint.
+        """
+        metrics_config = config['Metrics'] if config.has_section('Metrics') else {}
+        host = metrics_config.get('host', '127.0.0.1')
+        port = int(metrics_config.get('port', 9100)) + (self.cluster_id or 0)
+
+        async def handle_metrics(request):
+            return web.Response(text=self.render_metrics(), content_type='text/plain')
+
+        app = web.Application()
+        app.router.add_get('/metrics', handle_metrics)
+
+        self._metrics_runner = web.AppRunner(app)
+        await self._metrics_runner.setup()
+        try:
+            await web.TCPSite(self._metrics_runner, host, port).start()
+        except OSError as e:
+            print(f'Failed to serve metrics on {host}:{port}: {e}')
+            await self._metrics_runner.cleanup()
+            self._metrics_runner = None
+
+    async def load_prefixes(self):
+        """Load the prefixes of every guild the bot is in with a single
+        query, adding the default prefixes for guilds that do not have
+        any yet."""
+        guild_ids = [guild.id for guild in self.guilds]
+
+        query = '''with inserted as (
+                       insert into prefixes(guild_id, prefixes) select unnest($1::bigint[]), $2
+                       on conflict (guild_id) do nothing
+                       returning guild_id, prefixes
+                   )
+                   select guild_id, prefixes from inserted
+                   union all
+                   select guild_id, prefixes from prefixes where guild_id = any($1::bigint[]);'''
+        records = await self.database.fetch(query, guild_ids, DEFAULT_PREFIXES)
+
+        for record in records:
+            self.set_prefixes(record['guild_id'], record['prefixes'])
+
+    def set_prefixes(self, guild_id, prefixes):
+        """Cache the prefixes of a guild, replacing its prefix matcher.
+
+        Args
+        ----
+        guild_id: int
+            the id of the guild
+        prefixes: str[]
+            the prefixes of the guild
+        """
+        self.prefixes[guild_id] = prefixes
+        self.prefix_matchers.pop(guild_id, None)
+
+    def _invalidate_prefixes(self, guild_id, key):
+        if guild_id is None:
+            self.prefixes.clear()
+            self.prefix_matchers.clear()
+        else:
+            self.prefixes.pop(guild_id, None)
+            self.prefix_matchers.pop(guild_id, None)
+
+    async def get_prefix_matcher(self, guild_id):
+        """Get the prefix matcher of a guild, building it from the
+        guild's prefixes if it has not been built yet."""
+        matcher = self.prefix_matchers.get(guild_id)
+        if matcher is None:
+            prefixes = await self.get_guild_prefixes(guild_id)
+            matcher = PrefixMatcher.for_guild(self.user.id, prefixes)
+            self.prefix_matchers[guild_id] = matcher
+        return matcher
+
+    async def get_guild_prefixes(self, guild_id):
+        """Get the prefixes of a guild, loading them from the database
+        if they are not cached.
+
+        Concurrent calls for the same guild share a single query.
+
+        Returns
+        -------
+        the list of prefixes of the guild
+        """
+        prefixes = self.prefixes.get(guild_id)
+        if prefixes is not None:
+            return prefixes
+
+        load = self._prefix_loads.get(guild_id)
+        if load is None:
+            load = self.loop.create_task(self._load_guild_prefixes(guild_id))
+            load.add_done_callback(lambda _: self._prefix_loads.pop(guild_id, None))
+            self._prefix_loads[guild_id] = load
+
+        # The load is shielded so that a cancelled caller does not
+        # cancel it for every other caller waiting on it
+        return await asyncio.shield(load)
+
+    async def _load_guild_prefixes(self, guild_id):
+        query = '''with inserted as (
+                       insert into prefixes(guild_id, prefixes) values($1, $2)
+                       on conflict (guild_id) do nothing
+                       returning prefixes
+                   )
+                   select prefixes from inserted
+                   union all
+                   select prefixes from prefixes where guild_id = $1;'''
+        prefixes = await self.database.fetchval(query, guild_id, DEFAULT_PREFIXES)
+
+        return self.prefixes.setdefault(guild_id, prefixes)
+
+    async def close(self):
+        """Shut down the cogs, then close the connections to Discord,
+        the database, and the HTTP session.
+
+        Cogs that need to finish work before the bot closes, such as
+        flushing buffered writes, can define a ``shutdown`` coroutine.
+        Closing more than once, such as from a signal handler and after
+        the bot stops, waits for the first close to finish.
+        """
+        if self._close_task is None:
+            self._close_task = asyncio.ensure_future(self._close())
+        await asyncio.shield(self._close_task)
+
+    async def _close(self):
+        for cog in list(self.cogs.values()):
+            shutdown = getattr(cog, 'shutdown', None)
+            if shutdown is not None:
+                try:
+                    await shutdown()
+                except Exception as e:
+                    print(f'Failed to shut down {cog.qualified_name}: {e}')
+
+        await super().close()
+        await self.invalidation.close()
+        self.watchdog.stop()
+        self.process_stats.stop()
+
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+
+        if self.session is not None:
+            await self.session.close()
+
+        if hasattr(self, 'database'):
+            await self.database.close()
+
+    def local_status(self):
+        """
+        Returns
+        -------
+        a dict with the number of guilds and the latency of each shard
+        run by this process
+        """
+        return {
+            'guilds': len(self.guilds),
+            'users': len(self.users),
+            'latencies': dict(self.latencies),
+            'updated_at': time.time()
+        }
+
+    async def _report_cluster_status(self, interval=15.0):
+        await self.wait_until_ready()
+
+        while not self.is_closed():
+            status = self.local_status()
+            # The shared dict is a proxy to the launcher's process, so
+            # writing to it is a blocking call
+            await self.loop.run_in_executor(None, self.cluster_status.__setitem__,
+                                            self.cluster_id, status)
+            await asyncio.sleep(interval)
+
+    async def cluster_stats(self):
+        """Get the combined status of every cluster, or of this process
+        if it was not started by the launcher.
+
+        Returns
+        -------
+        a dict with the total number of clusters, guilds, and users, and
+        the latency of every shard
+        """
+        if self.cluster_status is None:
+            statuses = [self.local_status()]
+        else:
+            statuses = await self.loop.run_in_executor(None, lambda: list(self.cluster_status.values()))
+            if not statuses:
+                statuses = [self.local_status()]
+
+        return combine_statuses(statuses)
+
+    def database_credentials(self):
         credentials = config['PostgreSQL']
 
-        database_credentials = {
+        return {
             "user": credentials['user'],
             "password": credentials['password'],
             "database": credentials['database'],
             "host": credentials['host']
         }
 
-        self.database = await asyncpg.create_pool(**database_credentials)
+    async def setup_database(self):
+        credentials = config['PostgreSQL']
+        pool_config = {
+            'min_size': credentials.getint('min_size', fallback=10),
+            'max_size': credentials.getint('max_size', fallback=10),
+            'statement_cache_size': credentials.getint('statement_cache_size', fallback=100),
+            'command_timeout': credentials.getfloat('command_timeout', fallback=None)
+        }
+
+        pool = await asyncpg.create_pool(**self.database_credentials(), **pool_config)
+        self.database = InstrumentedPool(pool, pool_config)
 
-        await self.database.execute('create table if not exists prefixes(guild_id bigint PRIMARY KEY, prefixes text[])')
-        await self.database.execute('create table if not exists tags(id SERIAL PRIMARY KEY, name text, owner bigint, guild_id bigint, content text)')
+        await migrate(self.database)
+        await self.invalidation.start()
 
-    def load_extensions(self):
-        for file in os.listdir('cogs'):
-            if file.endswith('.py'):
-                ext = file[:-3]
-                try:
-                    self.load_extension(f'cogs.{ext}')
-                except Exception as e:
-                    print(f'Failed to load extension {ext}: {e}')
+    async def load_extensions(self):
+        """Load every extension in the cogs folder, recording how long
+        each one takes in ``startup_timings``.
+
+        Extensions are loaded one at a time on the event loop. Importing
+        them in threads does not help, since imports hold the GIL and
+        ``load_extension`` runs the module again anyway.
+        """
+        extensions = [f'cogs.{file[:-3]}' for file in sorted(os.listdir('cogs'))
+                      if file.endswith('.py')]
+
+        for extension in extensions:
+            start = time.perf_counter()
+            try:
+                self.load_extension(extension)
+            except Exception as e:
+                print(f'Failed to load extension {extension}: {e}')
+            self.startup_timings[extension] = time.perf_counter() - start
 
 
 if __name__ == '__main__':
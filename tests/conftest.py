@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The bot is run from the repository root, so its modules are imported
+# the same way in the tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+
+pytest.importorskip('arsenic')
+browser = pytest.importorskip('utils.browser')
+
+
+class FakeSession:
+    def __init__(self, responsive=True):
+        self.responsive = responsive
+
+    async def get_url(self):
+        if not self.responsive:
+            await asyncio.sleep(60)
+        return 'about:blank'
+
+
+class FakePool(browser.BrowserPool):
+    def __init__(self, sessions, **kwargs):
+        super().__init__(size=1, check_timeout=0.05, **kwargs)
+        self.sessions = list(sessions)
+        self.stopped = []
+
+    async def _create(self):
+        return browser.PooledBrowser(self.sessions.pop(0))
+
+    async def _stop(self, pooled):
+        self.stopped.append(pooled.session)
+
+
+def take_page(pool, error):
+    async def run():
+        await pool.start()
+        with pytest.raises(type(error)):
+            async with pool.acquire() as session:
+                raise error
+        # Let a replacement browser start
+        await asyncio.sleep(0)
+        return session
+
+    return run()
+
+
+def test_stuck_browser_is_replaced_after_timeout():
+    stuck, fresh = FakeSession(responsive=False), FakeSession()
+    pool = FakePool([stuck, fresh])
+
+    async def run():
+        session = await take_page(pool, asyncio.TimeoutError())
+        async with pool.acquire(timeout=1) as replacement:
+            return session, replacement
+
+    session, replacement = asyncio.run(run())
+    assert session is stuck
+    assert pool.stopped == [stuck]
+    assert replacement is fresh
+
+
+def test_responsive_browser_is_kept_after_timeout():
+    responsive = FakeSession()
+    pool = FakePool([responsive])
+
+    async def run():
+        await take_page(pool, asyncio.TimeoutError())
+        async with pool.acquire(timeout=1) as session:
+            return session
+
+    assert asyncio.run(run()) is responsive
+    assert pool.stopped == []
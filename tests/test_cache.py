@@ -0,0 +1,84 @@
+from utils.cache import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is LRUCache.MISSING
+    assert cache.get('a') == 1
+    assert cache.evictions == 1
+
+
+def test_expires_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('utils.cache.time.monotonic', lambda: now[0])
+    cache = LRUCache(ttl=10)
+    cache.set('a', 1)
+
+    now[0] += 11
+    assert cache.get('a') is LRUCache.MISSING
+    assert cache.expirations == 1
+
+
+def test_caches_none():
+    cache = LRUCache()
+    cache.set('a', None)
+
+    assert cache.get('a') is None
+    assert 'a' in cache
+
+
+def test_load_is_stored():
+    cache = LRUCache()
+    token = cache.begin_load('a')
+
+    assert cache.finish_load('a', token, 1)
+    assert cache.get('a') == 1
+
+
+def test_load_is_dropped_after_write():
+    cache = LRUCache()
+    token = cache.begin_load('a')
+    cache.set('a', 'new')
+
+    assert not cache.finish_load('a', token, 'old')
+    assert cache.get('a') == 'new'
+
+
+def test_load_is_dropped_after_invalidation():
+    cache = LRUCache()
+    for invalidate in (lambda: cache.invalidate(('guild', 'a')),
+                       lambda: cache.invalidate_where(lambda key: key[0] == 'guild'),
+                       cache.clear):
+        token = cache.begin_load(('guild', 'a'))
+        invalidate()
+
+        assert not cache.finish_load(('guild', 'a'), token, None)
+        assert ('guild', 'a') not in cache
+
+
+def test_failed_load_is_not_stored():
+    cache = LRUCache()
+    token = cache.begin_load('a')
+
+    assert not cache.finish_load('a', token)
+    assert 'a' not in cache
+    assert not cache._loads
+
+
+def test_overlapping_loads():
+    cache = LRUCache()
+    first = cache.begin_load('a')
+    second = cache.begin_load('a')
+    cache.invalidate('a')
+    third = cache.begin_load('a')
+
+    assert not cache.finish_load('a', first, 1)
+    assert not cache.finish_load('a', second, 2)
+    assert cache.finish_load('a', third, 3)
+    assert cache.get('a') == 3
+    assert not cache._loads
@@ -0,0 +1,110 @@
+from enum import Enum
+from utils.guild_stats import GuildStatsTracker
+
+
+class Status(Enum):
+    online = 'online'
+    idle = 'idle'
+    dnd = 'dnd'
+    offline = 'offline'
+
+
+class FakeRole:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeGuild:
+    def __init__(self, guild_id, roles=('@everyone',), chunked=True):
+        self.id = guild_id
+        self.members = []
+        self.roles = [FakeRole(name) for name in roles]
+        self.chunked = chunked
+
+
+class FakeMember:
+    def __init__(self, guild, status):
+        self.guild = guild
+        self.status = status
+
+
+def add_member(tracker, guild, status):
+    # discord.py adds the member to the guild before dispatching the
+    # event, and removes it before dispatching a removal
+    member = FakeMember(guild, status)
+    guild.members.append(member)
+    tracker.member_join(member)
+    return member
+
+
+def remove_member(tracker, member):
+    member.guild.members.remove(member)
+    tracker.member_remove(member)
+
+
+def change_status(tracker, member, status):
+    before = FakeMember(member.guild, member.status)
+    member.status = status
+    tracker.member_update(before, member)
+
+
+def test_events_match_recount():
+    guild = FakeGuild(1, roles=('@everyone', 'Admin'))
+    tracker = GuildStatsTracker()
+    members = [add_member(tracker, guild, Status.online) for _ in range(3)]
+
+    stats = tracker.get(guild)
+    assert stats.total == 3
+    assert stats.roles == 'Admin'
+
+    idle = add_member(tracker, guild, Status.idle)
+    add_member(tracker, guild, Status.offline)
+    remove_member(tracker, members[0])
+    change_status(tracker, members[1], Status.dnd)
+    change_status(tracker, idle, Status.offline)
+    # A member update that does not change the status
+    change_status(tracker, members[2], Status.online)
+    assert tracker.verify(guild)
+
+    guild.roles.append(FakeRole('Moderator'))
+    assert not tracker.verify(guild)
+    tracker.roles_changed(guild)
+    assert tracker.verify(guild)
+
+    stats = tracker.get(guild)
+    assert stats.total == 4
+    assert stats.status_counts[Status.offline.name] == 2
+    assert stats.status_counts[Status.online.name] == 1
+    assert stats.status_counts[Status.dnd.name] == 1
+    assert stats.status_counts[Status.idle.name] == 0
+
+
+def test_missed_event_fails_verification():
+    guild = FakeGuild(1)
+    tracker = GuildStatsTracker()
+    add_member(tracker, guild, Status.online)
+    tracker.get(guild)
+
+    guild.members.append(FakeMember(guild, Status.idle))
+    assert not tracker.verify(guild)
+
+
+def test_unchunked_guild_is_recounted():
+    guild = FakeGuild(1, chunked=False)
+    tracker = GuildStatsTracker()
+    assert tracker.get(guild).total == 0
+
+    # Members that arrive in chunks do not cause join events
+    guild.members.append(FakeMember(guild, Status.online))
+    assert tracker.get(guild).total == 1
+    assert tracker.verify(guild)
+
+
+def test_removed_guild_is_recounted():
+    guild = FakeGuild(1)
+    tracker = GuildStatsTracker()
+    tracker.get(guild)
+
+    tracker.remove_guild(guild)
+    guild.members.append(FakeMember(guild, Status.online))
+    assert tracker.get(guild).total == 1
@@ -0,0 +1,123 @@
+import asyncio
+import collections
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+from utils.http import HTTPCache  # noqa: E402
+
+
+def make_app(requests):
+    async def etag(request):
+        requests['etag'] += 1
+        if request.headers.get('If-None-Match') == '"v1"':
+            return web.Response(status=304)
+        return web.json_response({'version': 1}, headers={'ETag': '"v1"'})
+
+    async def last_modified(request):
+        requests['last_modified'] += 1
+        modified = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        if request.headers.get('If-Modified-Since') == modified:
+            return web.Response(status=304)
+        return web.json_response({'version': 1}, headers={'Last-Modified': modified})
+
+    async def slow(request):
+        requests['slow'] += 1
+        await asyncio.sleep(0.1)
+        return web.json_response({'request': requests['slow']})
+
+    async def missing(request):
+        requests['missing'] += 1
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_get('/etag', etag)
+    app.router.add_get('/last_modified', last_modified)
+    app.router.add_get('/slow', slow)
+    app.router.add_get('/missing', missing)
+    return app
+
+
+def run(test):
+    async def main():
+        requests = collections.Counter()
+        server = TestServer(make_app(requests))
+        await server.start_server()
+        try:
+            async with aiohttp.ClientSession() as session:
+                await test(HTTPCache(session), server, requests)
+        finally:
+            await server.close()
+
+    asyncio.run(main())
+
+
+def test_fresh_responses_are_cached():
+    async def test(cache, server, requests):
+        url = str(server.make_url('/etag'))
+        first = await cache.get(url, ttl=60)
+        second = await cache.get(url, ttl=60)
+
+        assert first.json() == second.json() == {'version': 1}
+        assert requests['etag'] == 1
+        assert cache.hits == 1
+
+    run(test)
+
+
+@pytest.mark.parametrize('path', ['/etag', '/last_modified'])
+def test_stale_responses_are_revalidated(path):
+    async def test(cache, server, requests):
+        url = str(server.make_url(path))
+        first = await cache.get(url, ttl=0.05)
+        await asyncio.sleep(0.1)
+        second = await cache.get(url, ttl=60)
+        third = await cache.get(url, ttl=60)
+
+        assert second is first and third is first
+        assert second.json() == {'version': 1}
+        assert requests[path[1:]] == 2
+        assert cache.revalidations == 1
+
+    run(test)
+
+
+def test_identical_requests_are_coalesced():
+    async def test(cache, server, requests):
+        url = str(server.make_url('/slow'))
+        responses = await asyncio.gather(*(cache.get(url) for _ in range(5)))
+
+        assert requests['slow'] == 1
+        assert {response.json()['request'] for response in responses} == {1}
+        assert cache.coalesced == 4
+
+        # Responses with no TTL are not cached once the request is done
+        await cache.get(url)
+        assert requests['slow'] == 2
+
+    run(test)
+
+
+def test_cancelled_caller_does_not_cancel_others():
+    async def test(cache, server, requests):
+        url = str(server.make_url('/slow'))
+        first = asyncio.ensure_future(cache.get(url))
+        second = asyncio.ensure_future(cache.get(url))
+        await asyncio.sleep(0.02)
+        first.cancel()
+
+        assert (await second).json() == {'request': 1}
+        assert requests['slow'] == 1
+
+    run(test)
+
+
+def test_errors_are_not_cached():
+    async def test(cache, server, requests):
+        url = str(server.make_url('/missing'))
+        assert (await cache.get(url, ttl=60)).status == 404
+        assert (await cache.get(url, ttl=60)).status == 404
+        assert requests['missing'] == 2
+
+    run(test)
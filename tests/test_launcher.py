@@ -0,0 +1,121 @@
+import time
+import pytest
+
+launcher = pytest.importorskip('launcher')
+
+
+class FakeProcess:
+    """Stands in for a worker process, which the test kills by hand."""
+    started = []
+
+    def __init__(self, target, args, name, daemon):
+        self.args = args
+        self.alive = False
+        self.exitcode = None
+        self.pid = len(self.started)
+
+    def start(self):
+        self.alive = True
+        self.started.append(self)
+
+    def is_alive(self):
+        return self.alive
+
+    def crash(self):
+        self.alive = False
+        self.exitcode = 1
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(launcher.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(launcher.multiprocessing, 'Process', FakeProcess)
+    FakeProcess.started = []
+    return now
+
+
+def make_launcher():
+    supervisor = launcher.Launcher(4, 2, restart_delay=5.0, max_restart_delay=60.0)
+    supervisor.status = {}
+    for cluster in supervisor.clusters:
+        supervisor._start_cluster(cluster)
+    return supervisor
+
+
+def crash_and_restart(supervisor, clock, cluster):
+    """Crash a cluster, and return how long the launcher waited before
+    restarting it."""
+    cluster.process.crash()
+    crashed_at = clock[0]
+    supervisor.check_clusters()
+
+    while not cluster.process.is_alive():
+        clock[0] += 1.0
+        supervisor.check_clusters()
+    return clock[0] - crashed_at
+
+
+def test_split_shards():
+    assert launcher.split_shards(10, 3) == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+    assert launcher.split_shards(2, 4) == [[0], [1]]
+
+
+def test_restart_delay_backs_off(clock):
+    supervisor = make_launcher()
+    cluster = supervisor.clusters[0]
+
+    delays = [crash_and_restart(supervisor, clock, cluster) for _ in range(6)]
+
+    assert delays == [5.0, 10.0, 20.0, 40.0, 60.0, 60.0]
+    assert supervisor.clusters[1].process is FakeProcess.started[1]
+
+
+def test_restart_delay_resets_after_long_run(clock):
+    supervisor = make_launcher()
+    cluster = supervisor.clusters[0]
+    for _ in range(3):
+        crash_and_restart(supervisor, clock, cluster)
+
+    clock[0] += 61.0
+    assert crash_and_restart(supervisor, clock, cluster) == 5.0
+
+
+def test_crashed_cluster_stops_reporting(clock):
+    supervisor = make_launcher()
+    supervisor.status[0] = {'guilds': 1, 'users': 2, 'latencies': {0: 0.1}}
+    supervisor.status[1] = {'guilds': 3, 'users': 4, 'latencies': {2: 0.2}}
+
+    supervisor.clusters[0].process.crash()
+    supervisor.check_clusters()
+
+    assert supervisor.aggregate_status() == {'clusters': 1, 'guilds': 3, 'users': 4, 'latencies': {2: 0.2}}
+
+
+def report_status(cluster_id, shard_ids, shard_count, cluster_status):
+    # A fake worker that reports a status like a connected cluster
+    # would, then exits as if it crashed
+    cluster_status[cluster_id] = {'guilds': len(shard_ids), 'users': 10,
+                                  'latencies': {shard_id: 0.05 for shard_id in shard_ids}}
+    time.sleep(0.5)
+    raise SystemExit(1)
+
+
+def test_workers_report_and_restart():
+    supervisor = launcher.Launcher(5, 2, target=report_status, restart_delay=0.0)
+    supervisor.start()
+    try:
+        deadline = time.monotonic() + 10
+        while len(supervisor.status) < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert supervisor.aggregate_status() == {
+            'clusters': 2, 'guilds': 5, 'users': 20,
+            'latencies': {shard_id: 0.05 for shard_id in range(5)}}
+
+        first_pid = supervisor.clusters[0].process.pid
+        while supervisor.clusters[0].restarts == 0 and time.monotonic() < deadline:
+            supervisor.check_clusters()
+            time.sleep(0.05)
+        assert supervisor.clusters[0].process.pid != first_pid
+    finally:
+        supervisor.stop(timeout=5)
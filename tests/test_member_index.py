@@ -0,0 +1,103 @@
+from utils.member_index import GuildNameIndex, rank_match, scan_members
+
+
+class FakeMember:
+    def __init__(self, member_id, name, nick=None):
+        self.id = member_id
+        self.name = name
+        self.display_name = nick or name
+
+
+def test_ranks_exact_then_prefix_then_substring():
+    members = [FakeMember(1, 'xalice'), FakeMember(2, 'alicebob'), FakeMember(3, 'alice')]
+    index = GuildNameIndex(members)
+
+    assert index.find('alice') == 3
+    assert index.find('ALICEB') == 2
+    assert index.find('xal') == 1
+    assert index.find('lice') == 3
+    assert index.find('nobody') is None
+
+
+def test_matches_display_names():
+    index = GuildNameIndex([FakeMember(1, 'someone', nick='Nickname')])
+
+    assert index.find('nick') == 1
+
+
+def best_rank(member, query):
+    ranks = [rank_match(name.lower(), query) for name in (member.name, member.display_name)]
+    return min(rank for rank in ranks if rank is not None)
+
+
+def test_matches_scan():
+    members = [FakeMember(i, f'user{i}', nick=f'n{i % 7}x') for i in range(200)]
+    by_id = {member.id: member for member in members}
+    index = GuildNameIndex(members)
+
+    # Members with equally good names can be picked in either order
+    for query in ('user1', 'user19', 'ser4', 'n3', '3x'):
+        expected = scan_members(members, query)
+        found = by_id[index.find(query)]
+        assert best_rank(found, query) == best_rank(expected, query)
+
+    assert index.find('zz') is None
+    assert scan_members(members, 'zz') is None
+
+
+def test_added_twice_leaves_no_ghost_entries():
+    index = GuildNameIndex([FakeMember(1, 'alice')])
+    index.add(FakeMember(1, 'alice'))
+    index.add(FakeMember(2, 'alicia'))
+    index.remove(1)
+
+    assert index.find('ali') == 2
+    assert index.find('alice') is None
+    assert len(index) == 1
+
+
+def test_update_renames():
+    index = GuildNameIndex([FakeMember(1, 'alice')])
+    index.update(FakeMember(1, 'bob'))
+
+    assert index.find('alice') is None
+    assert index.find('bob') == 1
+
+
+def test_merging_in_steps_matches_sort():
+    members = [FakeMember(i, f'user{(i * 7919) % 300}', nick=f'n{i}') for i in range(300)]
+    sorted_index = GuildNameIndex()
+    merged_index = GuildNameIndex()
+    for start in range(0, len(members), 50):
+        sorted_index.extend(members[start:start + 50])
+        merged_index.extend(members[start:start + 50])
+    sorted_index.sort()
+    steps = sum(1 for _ in merged_index.sort_in_steps(7))
+
+    assert steps > 1
+    for member in members:
+        assert merged_index.find(member.display_name) == member.id
+        assert merged_index.find(member.name) == sorted_index.find(member.name)
+
+
+def test_short_queries():
+    members = [FakeMember(1, 'xxqz'), FakeMember(2, 'yqz'), FakeMember(3, 'abc')]
+    index = GuildNameIndex(members)
+
+    # No name starts with these, so they are found by substring
+    assert index.find('qz') == 2
+    assert index.find('q') == 2
+    assert index.find('zq') is None
+
+    index.remove(2)
+    assert index.find('qz') == 1
+
+
+def test_one_character_query_looks_at_limited_members():
+    members = [FakeMember(i, f'x{i}a') for i in range(20)]
+    index = GuildNameIndex(members)
+    index.MAX_SHORT_CANDIDATES = 5
+
+    found = index.find('a')
+    assert found is not None
+    assert found in list(index._member_names)[:5]
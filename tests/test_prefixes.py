@@ -0,0 +1,20 @@
+from utils.prefixes import PrefixMatcher
+
+
+def test_matches_longest_prefix():
+    matcher = PrefixMatcher(['!', '!!', 'bot '])
+
+    assert matcher.match('!!help') == '!!'
+    assert matcher.match('!help') == '!'
+    assert matcher.match('bot help') == 'bot '
+    assert matcher.match('help') is None
+    assert matcher.match('') is None
+
+
+def test_guild_matcher_includes_mentions():
+    matcher = PrefixMatcher.for_guild(1234, ['-'])
+
+    assert matcher.match('<@1234> help') == '<@1234> '
+    assert matcher.match('<@!1234> help') == '<@!1234> '
+    assert matcher.match('-help') == '-'
+    assert matcher.match('<@5678> help') is None
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import pytest
+
+pytest.importorskip('discord')
+pytest.importorskip('asyncpg')
+main = pytest.importorskip('main')
+
+
+class FakePool:
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    main.config.read_dict({'PostgreSQL': {'user': 'user', 'password': 'password',
+                                          'database': 'database', 'host': 'localhost'}})
+
+    async def setup_database(self):
+        self.database = FakePool()
+
+    async def start_metrics_server(self):
+        pass
+
+    monkeypatch.setattr(main.Bot, 'setup_database', setup_database)
+    monkeypatch.setattr(main.Bot, 'start_metrics_server', start_metrics_server)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    bot = main.Bot(command_prefix='-', loop=loop)
+    yield bot
+
+    loop.run_until_complete(bot.close())
+    loop.close()
+
+
+def test_setup_records_startup_timings(bot, monkeypatch):
+    # Extensions are found relative to the working directory
+    monkeypatch.chdir(os.path.dirname(main.__file__))
+    bot.loop.run_until_complete(bot.setup())
+
+    cogs = os.path.join(os.path.dirname(main.__file__), 'cogs')
+    extensions = [f'cogs.{file[:-3]}' for file in os.listdir(cogs) if file.endswith('.py')]
+    for phase in ('session', 'database', 'extensions', 'metrics', 'setup', *extensions):
+        assert phase in bot.startup_timings
+
+    timings = bot.startup_timings
+    assert timings['setup'] >= timings['extensions'] >= max(timings[extension] for extension in extensions)
+    # The fake pool leaves only the HTTP session and extensions, so
+    # setup should take far less than this even on a slow machine
+    assert timings['setup'] < 30
+
+
+def test_first_ready_records_ready_time(bot, monkeypatch):
+    monkeypatch.chdir(os.path.dirname(main.__file__))
+    bot.loop.run_until_complete(bot.setup())
+
+    loads = []
+
+    async def load_prefixes():
+        loads.append(True)
+
+    async def do_nothing(*args, **kwargs):
+        pass
+
+    monkeypatch.setattr(bot, 'load_prefixes', load_prefixes)
+    monkeypatch.setattr(bot, 'change_presence', do_nothing)
+    monkeypatch.setattr(bot, 'get_app_info', do_nothing)
+
+    bot.loop.run_until_complete(bot.on_ready())
+    ready = bot.startup_timings['ready']
+    assert bot.startup_timings['setup'] <= ready < 30
+    assert 'prefixes' in bot.startup_timings
+
+    # Reconnecting dispatches on_ready again, which should not reload
+    # the prefixes or move the ready time
+    bot.loop.run_until_complete(bot.on_ready())
+    assert bot.startup_timings['ready'] == ready
+    assert len(loads) == 1
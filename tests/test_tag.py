@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip('discord')
+tag = pytest.importorskip('cogs.tag')
+
+
+def make_ctx(display_name):
+    return SimpleNamespace(author=SimpleNamespace(display_name=display_name),
+                           guild=SimpleNamespace(name='A Server'),
+                           channel=SimpleNamespace(mention='<#1>'))
+
+
+def render(content, display_name='Someone', args=''):
+    record = {'id': 1, 'name': 'tag', 'owner': 1, 'guild_id': 1, 'content': content}
+    return tag.CachedTag(record).render(make_ctx(display_name), args)
+
+
+def test_renders_variables():
+    assert render('{user} in {server} {channel}: {args}', args=' hi ') == 'Someone in A Server <#1>: hi'
+
+
+@pytest.mark.parametrize('mention', ['@everyone', '@here', '<@&123456789012345678>'])
+def test_args_cannot_mention_everyone_or_roles(mention):
+    assert mention not in render('{args}', args=f'ping {mention}')
+
+
+@pytest.mark.parametrize('mention', ['@everyone', '@here'])
+def test_display_name_cannot_mention_everyone(mention):
+    assert mention not in render('{user}', display_name=mention)
+
+
+def test_tags_never_mention_everyone_or_roles():
+    assert not tag.TAG_MENTIONS.everyone
+    assert not tag.TAG_MENTIONS.roles
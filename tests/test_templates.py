@@ -0,0 +1,25 @@
+from utils.templates import Template
+
+
+def test_renders_variables():
+    template = Template('Hi {user}, welcome to {server}! {args}')
+
+    assert template.render(user='A', server='B', args='C') == 'Hi A, welcome to B! C'
+
+
+def test_missing_values_are_empty():
+    assert Template('{user}:{channel}').render(user='A') == 'A:'
+
+
+def test_unknown_variables_are_kept():
+    assert Template('{unknown} {user}').render(user='A') == '{unknown} A'
+
+
+def test_text_without_variables_is_not_copied():
+    text = 'no variables here'
+
+    assert Template(text).render(user='A') is text
+
+
+def test_empty_text():
+    assert Template(None).render() == ''
@@ -0,0 +1,177 @@
+import asyncio
+import aiohttp
+from arsenic import start_session, stop_session
+from arsenic.browsers import Chrome
+from arsenic.services import Chromedriver
+
+
+class BrowserPoolFullError(Exception):
+    """Raised when too many callers are already waiting for a browser."""
+    pass
+
+
+class PooledBrowser:
+    __slots__ = ('session', 'uses')
+
+    def __init__(self, session):
+        self.session = session
+        self.uses = 0
+
+
+class _AcquireContext:
+    def __init__(self, pool, timeout):
+        self._pool = pool
+        self._timeout = timeout
+        self._browser = None
+
+    async def __aenter__(self):
+        self._browser = await self._pool._acquire(self._timeout)
+        return self._browser.session
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # A browser is checked after any error, including a timed out or
+        # cancelled page load, which can leave it stuck on the page. It
+        # is replaced if the check itself is interrupted.
+        broken = exc_type is not None
+        try:
+            if exc_type is not None:
+                broken = await self._pool._is_broken(self._browser, exc)
+        finally:
+            self._pool._release(self._browser, broken)
+
+
+class BrowserPool:
+    """A fixed number of headless Chrome sessions that are started ahead
+    of time and reused between screenshots.
+
+    Each browser is replaced after a number of uses, or as soon as it
+    stops responding, so leaks and crashes in Chrome do not build up. Callers wait
+    in a bounded queue for a free browser.
+
+    Args
+    ----
+    size: int
+        the number of browsers to keep running
+    max_waiting: int
+        the most callers that can wait for a browser at once
+    max_uses: int
+        the number of pages a browser loads before it is replaced
+    window_size: str
+        the size of the browser window, as ``width,height``
+    check_timeout: float
+        the most seconds a browser can take to respond after an error
+        before it is considered broken
+    """
+
+    def __init__(self, size=2, *, max_waiting=10, max_uses=50, window_size='1920,1080',
+                 check_timeout=5.0):
+        self.size = size
+        self.max_waiting = max_waiting
+        self.max_uses = max_uses
+        self.window_size = window_size
+        self.check_timeout = check_timeout
+
+        self._available = asyncio.Queue()
+        self._browsers = set()
+        self._waiting = 0
+        self._closed = False
+
+    async def _create(self):
+        service = Chromedriver()
+        browser = Chrome(chromeOptions={
+            'args': ['--headless', '--disable-gpu', f'--window-size={self.window_size}']
+        })
+        return PooledBrowser(await start_session(service, browser))
+
+    async def _add_browser(self, retry_delay=5.0):
+        while not self._closed:
+            try:
+                browser = await self._create()
+            except Exception as e:
+                print(f'Failed to start a browser: {e}')
+                await asyncio.sleep(retry_delay)
+                continue
+
+            if self._closed:
+                await stop_session(browser.session)
+                return
+
+            self._browsers.add(browser)
+            self._available.put_nowait(browser)
+            return
+
+    async def start(self):
+        """Start every browser in the pool."""
+        await asyncio.gather(*(self._add_browser() for _ in range(self.size)))
+
+    def acquire(self, timeout=None):
+        """Wait for a free browser.
+
+        Use with ``async with``, which gives the browser's session and
+        returns the browser to the pool afterwards.
+
+        Args
+        ----
+        timeout: float
+            the most seconds to wait for a browser
+
+        Raises
+        ------
+        BrowserPoolFullError:
+            if too many callers are already waiting
+        asyncio.TimeoutError:
+            if no browser became free in time
+        """
+        return _AcquireContext(self, timeout)
+
+    async def _acquire(self, timeout):
+        if self._waiting >= self.max_waiting:
+            raise BrowserPoolFullError()
+
+        self._waiting += 1
+        try:
+            browser = await asyncio.wait_for(self._available.get(), timeout)
+        finally:
+            self._waiting -= 1
+
+        browser.uses += 1
+        return browser
+
+    async def _is_broken(self, browser, error):
+        # Pages that fail to load, such as links to a host that does not
+        # exist, leave the browser usable. It is only replaced if the
+        # connection to it failed or its session stopped responding.
+        # WebDriver runs one command at a time, so a browser that is
+        # still loading a page does not answer until the load finishes.
+        # TimeoutError is a subclass of OSError on Python 3.11 and later
+        if (isinstance(error, (OSError, aiohttp.ClientConnectionError))
+                and not isinstance(error, asyncio.TimeoutError)):
+            return True
+
+        try:
+            await asyncio.wait_for(browser.session.get_url(), self.check_timeout)
+        except Exception:
+            return True
+        return False
+
+    def _release(self, browser, broken):
+        if not self._closed and not broken and browser.uses < self.max_uses:
+            self._available.put_nowait(browser)
+            return
+
+        self._browsers.discard(browser)
+        asyncio.ensure_future(self._stop(browser))
+        if not self._closed:
+            asyncio.ensure_future(self._add_browser())
+
+    async def _stop(self, browser):
+        try:
+            await stop_session(browser.session)
+        except Exception as e:
+            print(f'Failed to stop a browser: {e}')
+
+    async def close(self):
+        self._closed = True
+
+        browsers, self._browsers = self._browsers, set()
+        await asyncio.gather(*(self._stop(browser) for browser in browsers))
@@ -0,0 +1,174 @@
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A bounded mapping that evicts the least recently used entry once
+    it is full, and expires entries that are older than the time to
+    live.
+
+    A cached value of ``None`` is a valid entry, which allows misses to
+    be cached as well. Use ``LRUCache.MISSING`` to tell apart a cached
+    ``None`` from a key that is not in the cache.
+
+    Values loaded from somewhere slower should be stored with
+    ``begin_load`` and ``finish_load``, so a value that was read before
+    the key was written or invalidated does not replace the newer
+    entry.
+
+    Args
+    ----
+    max_size: int
+        the maximum number of entries to keep
+    ttl: float
+        the number of seconds an entry stays valid, or ``None`` if
+        entries never expire
+    """
+    MISSING = object()
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        # Key -> [number of loads in progress, number of changes to the
+        # key since they began]
+        self._loads = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not self.MISSING
+
+    def get(self, key, *, count=True):
+        """Get an entry from the cache.
+
+        Args
+        ----
+        key:
+            the key of the entry
+        count: bool
+            whether the lookup should be counted as a hit or miss
+
+        Returns
+        -------
+        the cached value, or ``LRUCache.MISSING`` if the key is not
+        cached or has expired
+        """
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at is None or expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+
+            del self._entries[key]
+            self.expirations += 1
+
+        if count:
+            self.misses += 1
+        return self.MISSING
+
+    def set(self, key, value):
+        """Add or replace an entry, evicting the least recently used
+        entry if the cache is full."""
+        self._changed(key)
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        """Remove an entry from the cache if it exists."""
+        self._changed(key)
+        self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Remove all entries whose key matches a predicate."""
+        for key in self._loads:
+            if predicate(key):
+                self._changed(key)
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    def clear(self):
+        for key in self._loads:
+            self._changed(key)
+        self._entries.clear()
+
+    def _changed(self, key):
+        load = self._loads.get(key)
+        if load is not None:
+            load[1] += 1
+
+    def begin_load(self, key):
+        """Start loading the value of a key. Every call must be
+        followed by a call to ``finish_load``, even if the load fails.
+
+        Returns
+        -------
+        a token to pass to ``finish_load``
+        """
+        load = self._loads.get(key)
+        if load is None:
+            load = self._loads[key] = [0, 0]
+        load[0] += 1
+        return load[1]
+
+    def finish_load(self, key, token, value=MISSING):
+        """Finish loading the value of a key, and store it unless the
+        key was set or invalidated since the load began.
+
+        Args
+        ----
+        key:
+            the key that was loaded
+        token:
+            the token returned by ``begin_load``
+        value:
+            the loaded value, or ``LRUCache.MISSING`` if the load failed
+
+        Returns
+        -------
+        whether the value was stored
+        """
+        load = self._loads[key]
+        load[0] -= 1
+        if not load[0]:
+            del self._loads[key]
+
+        if value is self.MISSING or load[1] != token:
+            return False
+        self.set(key, value)
+        return True
+
+    def stats(self):
+        """
+        Returns
+        -------
+        a dict with the size, capacity, and counters of the cache
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
@@ -0,0 +1,24 @@
+def combine_statuses(statuses):
+    """Combine the statuses reported by several clusters.
+
+    Args
+    ----
+    statuses: list of dict
+        the status of each cluster, as returned by
+        ``Bot.local_status``
+
+    Returns
+    -------
+    a dict with the number of clusters, the total number of guilds and
+    users, and the latency of every shard
+    """
+    latencies = {}
+    for status in statuses:
+        latencies.update(status['latencies'])
+
+    return {
+        'clusters': len(statuses),
+        'guilds': sum(status['guilds'] for status in statuses),
+        'users': sum(status['users'] for status in statuses),
+        'latencies': dict(sorted(latencies.items()))
+    }
@@ -1,5 +1,5 @@
 from discord.ext.commands import Converter, MemberConverter
-from discord import utils
+from utils.member_index import scan_members
 
 
 class InsensitiveMemberConverter(MemberConverter):
@@ -7,10 +7,11 @@ class InsensitiveMemberConverter(MemberConverter):
         try:
             return await super().convert(ctx, argument)
         except Exception as e:
-            member_to_find = argument.lower()
-            predicate = (lambda m: member_to_find in m.name.lower()
-                         or member_to_find in m.display_name.lower())
-            result = utils.find(predicate, ctx.guild.members)
+            member_index = getattr(ctx.bot, 'member_index', None)
+            if member_index is not None:
+                result = member_index.find(ctx.guild, argument)
+            else:
+                result = scan_members(ctx.guild.members, argument)
             if result:
                 return result
             raise e
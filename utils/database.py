@@ -0,0 +1,118 @@
+import time
+from utils.metrics import Histogram
+
+
+class StatementStats:
+    """The latency histogram and error count of one statement."""
+    __slots__ = ('latency', 'errors')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+
+
+class _AcquireContext:
+    def __init__(self, pool, timeout):
+        self._pool = pool
+        self._context = pool.pool.acquire(timeout=timeout)
+
+    async def __aenter__(self):
+        start = time.perf_counter()
+        connection = await self._context.__aenter__()
+        self._pool.acquire_wait.observe(time.perf_counter() - start)
+        self._pool.in_use += 1
+        return connection
+
+    async def __aexit__(self, *exc):
+        self._pool.in_use -= 1
+        return await self._context.__aexit__(*exc)
+
+
+class InstrumentedPool:
+    """Wraps an asyncpg pool to record how long each statement takes,
+    how often it fails, and how long callers wait for a connection.
+
+    Statements are told apart by their query text, so queries should
+    use parameters instead of formatting values into the text.
+
+    Args
+    ----
+    pool:
+        the asyncpg pool to wrap
+    config: dict
+        the options the pool was created with
+    """
+
+    def __init__(self, pool, config):
+        self.pool = pool
+        self.config = config
+
+        self.statements = {}
+        self.acquire_wait = Histogram()
+        self.in_use = 0
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+    def acquire(self, *, timeout=None):
+        return _AcquireContext(self, timeout)
+
+    async def _run(self, method, query, *args, **kwargs):
+        stats = self.statements.get(query)
+        if stats is None:
+            stats = self.statements[query] = StatementStats()
+
+        async with self.acquire() as connection:
+            start = time.perf_counter()
+            try:
+                return await getattr(connection, method)(query, *args, **kwargs)
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                stats.latency.observe(time.perf_counter() - start)
+
+    async def execute(self, query, *args, timeout=None):
+        return await self._run('execute', query, *args, timeout=timeout)
+
+    async def executemany(self, command, args, *, timeout=None):
+        return await self._run('executemany', command, args, timeout=timeout)
+
+    async def fetch(self, query, *args, timeout=None):
+        return await self._run('fetch', query, *args, timeout=timeout)
+
+    async def fetchrow(self, query, *args, timeout=None):
+        return await self._run('fetchrow', query, *args, timeout=timeout)
+
+    async def fetchval(self, query, *args, column=0, timeout=None):
+        return await self._run('fetchval', query, *args, column=column, timeout=timeout)
+
+    async def close(self):
+        await self.pool.close()
+
+    def pool_stats(self):
+        """
+        Returns
+        -------
+        a dict with the options of the pool, the number of connections
+        in use, and how long callers have waited for a connection
+        """
+        return {
+            **self.config,
+            'in_use': self.in_use,
+            'acquires': self.acquire_wait.count,
+            'acquire_wait_mean': self.acquire_wait.mean,
+            'acquire_wait_p99': self.acquire_wait.quantile(0.99),
+            'acquire_wait_max': self.acquire_wait.max
+        }
+
+    def slowest(self, limit=10):
+        """Find the statements that have taken the most time in total.
+
+        Returns
+        -------
+        a list of at most ``limit`` (query, stats) pairs, slowest first
+        """
+        statements = sorted(self.statements.items(),
+                            key=lambda item: item[1].latency.sum, reverse=True)
+        return statements[:limit]
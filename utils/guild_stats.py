@@ -0,0 +1,87 @@
+from collections import Counter
+
+
+def count_statuses(members):
+    return Counter(member.status.name for member in members)
+
+
+def summarize_roles(guild):
+    return ', '.join(role.name for role in guild.roles if role.name != '@everyone')
+
+
+class GuildStats:
+    """The member status counts and role summary of a guild."""
+    __slots__ = ('status_counts', 'total', 'roles')
+
+    def __init__(self, guild):
+        self.status_counts = count_statuses(guild.members)
+        self.total = sum(self.status_counts.values())
+        self.roles = summarize_roles(guild)
+
+
+class GuildStatsTracker:
+    """Keeps the stats of each guild up to date from gateway events, so
+    reading them does not have to go through every member.
+
+    A guild's stats are counted in full the first time they are read,
+    and only adjusted by events after that. Guilds that have not been
+    fully chunked yet are counted in full on every read, since members
+    that arrive in chunks do not cause join events.
+    """
+
+    def __init__(self):
+        self._guilds = {}
+
+    def get(self, guild):
+        stats = self._guilds.get(guild.id)
+        if stats is None:
+            stats = GuildStats(guild)
+            if guild.chunked:
+                self._guilds[guild.id] = stats
+        return stats
+
+    def remove_guild(self, guild):
+        self._guilds.pop(guild.id, None)
+
+    def member_join(self, member):
+        stats = self._guilds.get(member.guild.id)
+        if stats is not None:
+            stats.status_counts[member.status.name] += 1
+            stats.total += 1
+
+    def member_remove(self, member):
+        stats = self._guilds.get(member.guild.id)
+        if stats is not None:
+            stats.status_counts[member.status.name] -= 1
+            stats.total -= 1
+
+    def member_update(self, before, after):
+        if before.status == after.status:
+            return
+
+        stats = self._guilds.get(after.guild.id)
+        if stats is not None:
+            stats.status_counts[before.status.name] -= 1
+            stats.status_counts[after.status.name] += 1
+
+    def roles_changed(self, guild):
+        stats = self._guilds.get(guild.id)
+        if stats is not None:
+            stats.roles = summarize_roles(guild)
+
+    def verify(self, guild):
+        """Check the tracked stats of a guild against a full recount.
+
+        Returns
+        -------
+        True if the stats match, or if the guild is not tracked
+        """
+        stats = self._guilds.get(guild.id)
+        if stats is None:
+            return True
+
+        expected = count_statuses(guild.members)
+        actual = +stats.status_counts
+        return (actual == expected
+                and stats.total == sum(expected.values())
+                and stats.roles == summarize_roles(guild))
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import time
+from utils.cache import LRUCache
+
+
+class CachedResponse:
+    """The parts of an HTTP response that are kept in the cache."""
+    __slots__ = ('status', 'body', 'etag', 'last_modified', 'expires_at')
+
+    def __init__(self, status, body, etag=None, last_modified=None, expires_at=0.0):
+        self.status = status
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self):
+        return self.expires_at > time.monotonic()
+
+    def text(self, encoding='utf-8'):
+        return self.body.decode(encoding)
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class HTTPCache:
+    """Caches GET requests made through an aiohttp session.
+
+    Each request chooses how many seconds its response stays fresh.
+    Once a response is stale it is revalidated with its ETag or
+    Last-Modified header, so an unchanged resource is not downloaded
+    again. Identical requests made at the same time share a single
+    request, including requests that are not cached.
+
+    Args
+    ----
+    session: aiohttp.ClientSession
+        the session to make requests with
+    max_size: int
+        the number of responses to keep
+    """
+
+    def __init__(self, session, *, max_size=256):
+        self.session = session
+
+        # Entries do not expire in the LRU cache, since stale responses
+        # are kept to be revalidated
+        self.cache = LRUCache(max_size)
+        self._in_flight = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.coalesced = 0
+
+    async def get(self, url, *, ttl=0):
+        """Get a URL, using a cached response while it is fresh.
+
+        Args
+        ----
+        url: str
+            the URL to get
+        ttl: float
+            the number of seconds the response stays fresh. Responses
+            with a TTL of 0 are not cached, but are still shared with
+            identical requests that are in flight.
+
+        Returns
+        -------
+        a CachedResponse
+        """
+        entry = self.cache.get(url, count=False)
+        if entry is not LRUCache.MISSING and entry.fresh:
+            self.hits += 1
+            return entry
+
+        task = self._in_flight.get(url)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            stale = entry if entry is not LRUCache.MISSING else None
+            task = asyncio.ensure_future(self._fetch(url, stale, ttl))
+            self._in_flight[url] = task
+            task.add_done_callback(lambda _: self._finish(url, task))
+
+        # Shielded so a cancelled caller does not cancel the request for
+        # everyone else waiting on it
+        return await asyncio.shield(task)
+
+    def _finish(self, url, task):
+        if self._in_flight.get(url) is task:
+            del self._in_flight[url]
+        if not task.cancelled():
+            # Marks the exception as retrieved if every caller was
+            # cancelled before the request finished
+            task.exception()
+
+    async def _fetch(self, url, stale, ttl):
+        headers = {}
+        if stale is not None:
+            if stale.etag is not None:
+                headers['If-None-Match'] = stale.etag
+            if stale.last_modified is not None:
+                headers['If-Modified-Since'] = stale.last_modified
+
+        async with self.session.get(url, headers=headers) as r:
+            if r.status == 304 and stale is not None:
+                self.revalidations += 1
+                stale.expires_at = time.monotonic() + ttl
+                return stale
+
+            response = CachedResponse(r.status, await r.read(),
+                                      etag=r.headers.get('ETag'),
+                                      last_modified=r.headers.get('Last-Modified'),
+                                      expires_at=time.monotonic() + ttl)
+
+        if r.status == 200 and ttl > 0:
+            self.cache.set(url, response)
+        return response
+
+    def stats(self):
+        """
+        Returns
+        -------
+        a dict with the same counters as ``LRUCache.stats``, along with
+        the number of revalidated and coalesced requests
+        """
+        stats = self.cache.stats()
+        lookups = self.hits + self.misses + self.coalesced
+        stats.update(hits=self.hits,
+                     misses=self.misses,
+                     hit_rate=self.hits / lookups if lookups else 0.0,
+                     revalidations=self.revalidations,
+                     coalesced=self.coalesced)
+        return stats
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import uuid
+import asyncpg
+
+
+class InvalidationBus:
+    """Tells every bot process sharing the database when a cached
+    entry has changed, using PostgreSQL's LISTEN and NOTIFY.
+
+    Writers send an event with the kind of entry that changed, the
+    guild it belongs to, and optionally a key within that guild. Every
+    other process then calls the handlers subscribed to that kind, so
+    they can drop or reload their copy of the entry. Events sent
+    by a process are not delivered back to itself.
+
+    Events are sent in the same statement as the write, by calling
+    ``pg_notify`` with the arguments from ``notification``, so they are
+    only sent if the write commits and cost no extra round trip.
+
+    The bus listens on a dedicated connection that is not part of the
+    pool. If the connection is lost, it is reopened, and every handler
+    is called with a guild id of None since events may have been missed
+    in the meantime.
+
+    Args
+    ----
+    connect_kwargs: dict
+        the arguments used to open the listening connection
+    channel: str
+        the name of the notification channel
+    check_interval: float
+        the number of seconds between checks of the connection
+    """
+
+    def __init__(self, connect_kwargs, *, channel='rd_bot_invalidate', check_interval=5.0):
+        self.connect_kwargs = connect_kwargs
+        self.channel = channel
+        self.check_interval = check_interval
+
+        self.origin = uuid.uuid4().hex
+
+        self._connection = None
+        self._task = None
+        self._handlers = {}
+
+    def subscribe(self, kind, handler):
+        """Call a handler whenever an entry of some kind changes.
+
+        Args
+        ----
+        kind: str
+            the kind of entry, such as ``'prefixes'`` or ``'tag'``
+        handler: function
+            called with the guild id and key of the entry that changed.
+            Both are None if every entry should be dropped.
+        """
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def unsubscribe(self, kind, handler):
+        handlers = self._handlers.get(kind, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def notification(self, kind, guild_id, key=None):
+        """
+        Returns
+        -------
+        the channel and payload to pass to ``pg_notify`` to tell the
+        other processes that an entry has changed
+        """
+        payload = json.dumps({'origin': self.origin,
+                              'kind': kind,
+                              'guild_id': guild_id,
+                              'key': key})
+        return self.channel, payload
+
+    async def start(self):
+        """Start listening for events."""
+        await self._connect()
+        self._task = asyncio.ensure_future(self._watch_connection())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.close()
+        self._connection = None
+
+    async def _connect(self):
+        self._connection = await asyncpg.connect(**self.connect_kwargs)
+        await self._connection.add_listener(self.channel, self._on_notification)
+
+    async def _watch_connection(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+
+            if not self._connection.is_closed():
+                continue
+
+            try:
+                await self._connect()
+            except (OSError, asyncpg.PostgresError) as e:
+                print(f'Failed to reconnect the invalidation listener: {e}')
+                continue
+
+            self._drop_everything()
+
+    def _on_notification(self, connection, pid, channel, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+
+        if event.get('origin') == self.origin:
+            return
+
+        for handler in list(self._handlers.get(event.get('kind'), [])):
+            handler(event.get('guild_id'), event.get('key'))
+
+    def _drop_everything(self):
+        for handlers in list(self._handlers.values()):
+            for handler in list(handlers):
+                handler(None, None)
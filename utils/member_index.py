@@ -0,0 +1,325 @@
+import asyncio
+import bisect
+import heapq
+import itertools
+from collections import defaultdict
+
+
+def _names_of(member):
+    return {member.name.lower(), member.display_name.lower()}
+
+
+def _entry(name, member_id):
+    # Entries are strings rather than tuples since strings sort several
+    # times faster, which matters when indexing a large guild
+    return f'{name}\0{member_id}'
+
+
+def _ngrams(name, length):
+    return {name[i:i + length] for i in range(len(name) - length + 1)}
+
+
+class GuildNameIndex:
+    """An index of the lowercase names and display names of the members
+    of a guild.
+
+    Names are kept in a sorted list to find exact and prefix matches
+    with a binary search, and split into trigrams to find substring
+    matches by intersecting the members that share every trigram of
+    the search. Searches of two characters use an index of bigrams
+    instead, and searches of one character look at a limited number of
+    members.
+
+    Args
+    ----
+    members: iterable of discord.Member
+        the members to index
+    """
+
+    # The most prefix matches looked at before picking the best one
+    MAX_PREFIX_CANDIDATES = 1000
+    # The most members looked at for a search shorter than a trigram
+    # that does not start any name, so the best of them is picked
+    # rather than the best in the guild
+    MAX_SHORT_CANDIDATES = 5000
+
+    def __init__(self, members=()):
+        self._names = []
+        # Sorted lists of names added by extend and not merged yet
+        self._runs = []
+        self._trigrams = defaultdict(set)
+        self._bigrams = defaultdict(set)
+        self._member_names = {}
+
+        self.extend(members)
+        self.sort()
+
+    def _index_name(self, name, member_id):
+        for trigram in _ngrams(name, 3):
+            self._trigrams[trigram].add(member_id)
+        for bigram in _ngrams(name, 2):
+            self._bigrams[bigram].add(member_id)
+
+    def _unindex_name(self, name, member_id):
+        for ngrams, length in ((self._trigrams, 3), (self._bigrams, 2)):
+            for ngram in _ngrams(name, length):
+                ids = ngrams.get(ngram)
+                if ids is not None:
+                    ids.discard(member_id)
+                    if not ids:
+                        del ngrams[ngram]
+
+    def extend(self, members):
+        """Add many members at once. ``sort`` or ``sort_in_steps`` must
+        be called before the index is searched or changed again."""
+        entries = []
+        for member in members:
+            names = _names_of(member)
+            self._member_names[member.id] = names
+            for name in names:
+                entries.append(_entry(name, member.id))
+                self._index_name(name, member.id)
+        entries.sort()
+        self._runs.append(entries)
+
+    def _take_runs(self):
+        runs = [run for run in (self._names, *self._runs) if run]
+        self._runs = []
+        return runs
+
+    def sort(self):
+        runs = self._take_runs()
+        # Sorting already sorted runs only merges them
+        self._names = [entry for run in runs for entry in run]
+        if len(runs) > 1:
+            self._names.sort()
+
+    def sort_in_steps(self, step):
+        """Merge the names added by ``extend`` into the index a number
+        of names at a time, yielding between steps so the caller can
+        give control back to the event loop. The index must not be
+        used until the generator is exhausted."""
+        runs = self._take_runs()
+        if len(runs) <= 1:
+            self._names = runs[0] if runs else []
+            return
+
+        merged = heapq.merge(*runs)
+        names = []
+        while True:
+            size = len(names)
+            names.extend(itertools.islice(merged, step))
+            if len(names) - size < step:
+                break
+            yield
+        self._names = names
+
+    def __len__(self):
+        return len(self._member_names)
+
+    def add(self, member):
+        # A member can be added twice, such as when a join event is
+        # replayed for a member that was already indexed
+        self.remove(member.id)
+
+        names = _names_of(member)
+        self._member_names[member.id] = names
+        for name in names:
+            bisect.insort(self._names, _entry(name, member.id))
+            self._index_name(name, member.id)
+
+    def remove(self, member_id):
+        names = self._member_names.pop(member_id, ())
+        for name in names:
+            entry = _entry(name, member_id)
+            index = bisect.bisect_left(self._names, entry)
+            if index < len(self._names) and self._names[index] == entry:
+                del self._names[index]
+            self._unindex_name(name, member_id)
+
+    def update(self, member):
+        if _names_of(member) != self._member_names.get(member.id):
+            self.add(member)
+
+    def find(self, query):
+        """Find the member whose name or display name best matches a
+        search.
+
+        An exact match ranks above a name that starts with the search,
+        which ranks above a name that contains it. Between names of the
+        same rank, the shortest name wins, since more of it matched.
+
+        Returns
+        -------
+        the id of the best matching member, or None if no name contains
+        the search
+        """
+        query = query.lower()
+        if not query:
+            return None
+
+        best = None
+        start = bisect.bisect_left(self._names, query)
+        for entry in self._names[start:start + self.MAX_PREFIX_CANDIDATES]:
+            if not entry.startswith(query):
+                break
+            name, _, member_id = entry.rpartition('\0')
+            member_id = int(member_id)
+            if name == query:
+                return member_id
+            if best is None or len(name) < len(best[0]):
+                best = (name, member_id)
+        if best is not None:
+            return best[1]
+
+        if len(query) >= 3:
+            trigram_sets = sorted((self._trigrams.get(trigram, set()) for trigram in _ngrams(query, 3)),
+                                  key=len)
+            candidates = trigram_sets[0].intersection(*trigram_sets[1:])
+        elif len(query) == 2:
+            candidates = itertools.islice(self._bigrams.get(query, ()), self.MAX_SHORT_CANDIDATES)
+        else:
+            candidates = itertools.islice(self._member_names, self.MAX_SHORT_CANDIDATES)
+
+        for member_id in candidates:
+            for name in self._member_names[member_id]:
+                if query in name and (best is None or len(name) < len(best[0])):
+                    best = (name, member_id)
+        return best[1] if best is not None else None
+
+
+def rank_match(name, query):
+    """Rank how well a lowercase name matches a search, the same way
+    as ``GuildNameIndex.find``.
+
+    Returns
+    -------
+    a sort key where lower is better, or None if the name does not
+    contain the search
+    """
+    if name == query:
+        return (0, 0)
+    if name.startswith(query):
+        return (1, len(name))
+    if query in name:
+        return (2, len(name))
+    return None
+
+
+def scan_members(members, query):
+    """Find the best matching member by going through every member.
+    Used for guilds that are not indexed yet."""
+    query = query.lower()
+    if not query:
+        return None
+
+    best = None
+    best_rank = None
+    for member in members:
+        for name in _names_of(member):
+            rank = rank_match(name, query)
+            if rank is not None and (best_rank is None or rank < best_rank):
+                best, best_rank = member, rank
+    return best
+
+
+class MemberNameIndex:
+    """The name indexes of every guild, kept up to date from member
+    events.
+
+    A guild is indexed in the background the first time it is searched,
+    a chunk of members at a time so the event loop is not blocked on
+    large guilds. Each chunk is sorted on its own, and the chunks are
+    merged a chunk's worth of names at a time. Until the index is ready, searches go through every
+    member. Guilds that have not been fully chunked yet are not
+    indexed, since members that arrive in chunks do not cause join
+    events.
+
+    Args
+    ----
+    chunk_size: int
+        the number of members to index before yielding to the event
+        loop
+    """
+
+    def __init__(self, chunk_size=500):
+        self.chunk_size = chunk_size
+
+        self._guilds = {}
+        # Guild id -> changes to apply once the guild's index is built
+        self._building = {}
+
+    def find(self, guild, query):
+        """Find the member of a guild that best matches a search.
+
+        Returns
+        -------
+        the matching member, or None if no member matches
+        """
+        index = self._guilds.get(guild.id)
+        if index is None:
+            if guild.chunked and guild.id not in self._building:
+                self._building[guild.id] = []
+                asyncio.ensure_future(self._build(guild))
+            return scan_members(guild.members, query)
+
+        member_id = index.find(query)
+        return guild.get_member(member_id) if member_id is not None else None
+
+    async def _build(self, guild):
+        index = GuildNameIndex()
+        members = guild.members
+
+        try:
+            for start in range(0, len(members), self.chunk_size):
+                index.extend(members[start:start + self.chunk_size])
+                await asyncio.sleep(0)
+            # Each member has up to two names to merge
+            for _ in index.sort_in_steps(2 * self.chunk_size):
+                await asyncio.sleep(0)
+        finally:
+            changes = self._building.pop(guild.id, None)
+
+        # The guild was removed while it was being indexed
+        if changes is None:
+            return
+
+        for change in changes:
+            change(index)
+        self._guilds[guild.id] = index
+
+    def _change(self, guild_id, change):
+        index = self._guilds.get(guild_id)
+        if index is not None:
+            change(index)
+        elif guild_id in self._building:
+            self._building[guild_id].append(change)
+
+    def remove_guild(self, guild):
+        self._guilds.pop(guild.id, None)
+        self._building.pop(guild.id, None)
+
+    def member_join(self, member):
+        self._change(member.guild.id, lambda index: index.add(member))
+
+    def member_remove(self, member):
+        self._change(member.guild.id, lambda index: index.remove(member.id))
+
+    def member_update(self, member):
+        self._change(member.guild.id, lambda index: index.update(member))
+
+    def user_update(self, bot, user):
+        """Update the names of a user in every guild it is in.
+
+        Args
+        ----
+        bot:
+            the bot, used to look up the guilds
+        user:
+            the user whose name changed
+        """
+        for guild_id in list(self._guilds) + list(self._building):
+            guild = bot.get_guild(guild_id)
+            member = guild.get_member(user.id) if guild is not None else None
+            if member is not None:
+                self.member_update(member)
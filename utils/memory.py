@@ -0,0 +1,63 @@
+import sys
+from collections import deque
+
+
+def deep_sizeof(obj, seen=None):
+    """Estimate the memory used by an object and everything it
+    references, counting shared objects once.
+
+    Containers, mappings, and the attributes of objects with a
+    ``__dict__`` or ``__slots__`` are followed. Modules, classes, and
+    functions are not, so the size stays limited to the data held by
+    the object.
+
+    Returns
+    -------
+    the estimated size in bytes
+    """
+    if seen is None:
+        seen = set()
+
+    size = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, (type, type(sys), type(deep_sizeof))):
+            continue
+        seen.add(id(current))
+
+        try:
+            size += sys.getsizeof(current)
+        except TypeError:
+            continue
+
+        if isinstance(current, (str, bytes, bytearray, int, float)):
+            continue
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset, deque)):
+            stack.extend(current)
+        elif hasattr(current, 'items') and hasattr(current, 'keys'):
+            try:
+                for key, value in current.items():
+                    stack.append(key)
+                    stack.append(value)
+            except Exception:
+                pass
+
+        if hasattr(current, '__dict__'):
+            stack.append(current.__dict__)
+        for slot in getattr(type(current), '__slots__', ()):
+            if hasattr(current, slot):
+                stack.append(getattr(current, slot))
+
+    return size
+
+
+def format_size(size):
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
@@ -0,0 +1,151 @@
+import bisect
+import collections
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Counts observed values, such as latencies in seconds, in fixed
+    buckets. Recording a value takes constant memory, however many
+    values are recorded.
+
+    Args
+    ----
+    buckets: tuple of float
+        the upper bounds of the buckets, in increasing order. Values
+        above the last bound are counted in an extra overflow bucket.
+    """
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """Estimate a quantile of the observed values.
+
+        Returns
+        -------
+        the upper bound of the bucket the quantile falls in, or the
+        largest observed value if it falls in the overflow bucket
+        """
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative_counts(self):
+        """
+        Returns
+        -------
+        a list of (upper bound, number of values at or below it) pairs,
+        ending with an infinite bound that counts every value
+        """
+        cumulative = []
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            cumulative.append((bound, seen))
+        return cumulative
+
+
+class RollingWindow:
+    """Keeps the most recent values, such as latencies in seconds, to
+    compute exact percentiles over them.
+
+    Args
+    ----
+    size: int
+        the number of most recent values to keep
+    """
+    __slots__ = ('values',)
+
+    def __init__(self, size=100):
+        self.values = collections.deque(maxlen=size)
+
+    def __len__(self):
+        return len(self.values)
+
+    def observe(self, value):
+        self.values.append(value)
+
+    def percentile(self, q):
+        """
+        Returns
+        -------
+        the value that the given fraction of the kept values are at or
+        below, using the nearest rank, or 0 if no values are kept
+        """
+        if not self.values:
+            return 0.0
+
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))]
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+class PrometheusWriter:
+    """Builds a page of metrics in the Prometheus text format.
+
+    Each metric name is described once, the first time it is written,
+    so the same metric can be written several times with different
+    labels.
+    """
+
+    def __init__(self):
+        self._lines = []
+        self._described = set()
+
+    def _describe(self, name, kind, description):
+        if name not in self._described:
+            self._described.add(name)
+            self._lines.append(f'# HELP {name} {description}')
+            self._lines.append(f'# TYPE {name} {kind}')
+
+    def gauge(self, name, description, value, **labels):
+        self._describe(name, 'gauge', description)
+        self._lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    def counter(self, name, description, value, **labels):
+        self._describe(name, 'counter', description)
+        self._lines.append(f'{name}{_format_labels(labels)} {value}')
+
+    def histogram(self, name, description, histogram, **labels):
+        self._describe(name, 'histogram', description)
+
+        for bound, count in histogram.cumulative_counts():
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            self._lines.append(f'{name}_bucket{_format_labels({**labels, "le": le})} {count}')
+        self._lines.append(f'{name}_sum{_format_labels(labels)} {histogram.sum}')
+        self._lines.append(f'{name}_count{_format_labels(labels)} {histogram.count}')
+
+    def render(self):
+        return '\n'.join(self._lines) + '\n'
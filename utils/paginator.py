@@ -0,0 +1,118 @@
+import asyncio
+import math
+import discord
+from utils.messages import ColoredEmbed
+
+
+class KeysetPaginator:
+    """Show the results of a query one page at a time, with reactions
+    to move between pages.
+
+    Pages are fetched on demand using keyset pagination: each page is
+    requested with the last key of the page before it, so only the
+    rows of the page being shown are ever loaded.
+
+    Args
+    ----
+    ctx:
+        the context of the command
+    title: str
+        the title of the embed
+    fetch_page: coroutine function
+        called with the last key of the previous page (or an empty
+        string for the first page) and the number of rows to fetch,
+        and returns the keys in the page
+    total: int
+        the total number of rows
+    format_key: function
+        turns a key into the line shown for it
+    per_page: int
+        the number of rows per page
+    timeout: float
+        the number of seconds to wait for a reaction before the
+        paginator stops
+    """
+    FIRST = '⏮'
+    PREVIOUS = '◀'
+    NEXT = '▶'
+    STOP = '⏹'
+
+    def __init__(self, ctx, title, fetch_page, total, *, format_key=str,
+                 per_page=20, timeout=60.0):
+        self.ctx = ctx
+        self.title = title
+        self.fetch_page = fetch_page
+        self.total = total
+        self.format_key = format_key
+        self.per_page = per_page
+        self.timeout = timeout
+
+        self.pages = max(1, math.ceil(total / per_page))
+        self.page = 0
+        # The key to fetch each page after. Pages can only be reached
+        # by going forward from an earlier page, so the keys of all
+        # the pages visited so far are kept to be able to go back.
+        self.cursors = ['']
+
+    async def _create_embed(self):
+        keys = await self.fetch_page(self.cursors[self.page], self.per_page)
+
+        if keys and self.page + 1 == len(self.cursors) and self.page + 1 < self.pages:
+            self.cursors.append(keys[-1])
+
+        lines = '\n'.join(self.format_key(key) for key in keys)
+
+        embed = ColoredEmbed(title=self.title, description=lines)
+        embed.set_footer(text=f'Page {self.page + 1}/{self.pages} ({self.total} total)')
+        return embed
+
+    def _check(self, message):
+        def predicate(reaction, user):
+            return (reaction.message.id == message.id
+                    and user.id == self.ctx.author.id
+                    and str(reaction.emoji) in (self.FIRST, self.PREVIOUS, self.NEXT, self.STOP))
+        return predicate
+
+    async def start(self):
+        """Send the first page and handle reactions until the paginator
+        times out or is stopped."""
+        message = await self.ctx.send(embed=await self._create_embed())
+
+        if self.pages == 1:
+            return
+
+        for emoji in (self.FIRST, self.PREVIOUS, self.NEXT, self.STOP):
+            await message.add_reaction(emoji)
+
+        bot = self.ctx.bot
+        while True:
+            try:
+                reaction, user = await bot.wait_for('reaction_add', check=self._check(message),
+                                                    timeout=self.timeout)
+            except asyncio.TimeoutError:
+                break
+
+            emoji = str(reaction.emoji)
+            if emoji == self.STOP:
+                break
+
+            try:
+                await message.remove_reaction(reaction.emoji, user)
+            except discord.HTTPException:
+                pass
+
+            if emoji == self.FIRST:
+                page = 0
+            elif emoji == self.PREVIOUS:
+                page = max(0, self.page - 1)
+            else:
+                page = min(self.pages - 1, self.page + 1)
+
+            if page != self.page:
+                self.page = page
+                await message.edit(embed=await self._create_embed())
+
+        try:
+            await message.clear_reactions()
+        except discord.HTTPException:
+            pass
@@ -0,0 +1,63 @@
+_END = None
+
+
+class PrefixMatcher:
+    """A trie of the prefixes of a guild, used to find the prefix a
+    message starts with.
+
+    Matching walks the trie one character at a time, so a message is
+    rejected as soon as it stops matching every prefix. Most messages
+    are rejected on their first character, no matter how many prefixes
+    the guild has.
+
+    Args
+    ----
+    prefixes: iterable of str
+        the prefixes to match, including any mention prefixes
+    """
+    __slots__ = ('_root',)
+
+    def __init__(self, prefixes):
+        self._root = {}
+
+        for prefix in prefixes:
+            if not prefix:
+                continue
+
+            node = self._root
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[_END] = prefix
+
+    @classmethod
+    def for_guild(cls, user_id, prefixes):
+        """Create a matcher for the prefixes of a guild that also
+        matches mentions of the bot.
+
+        Args
+        ----
+        user_id: int
+            the id of the bot user
+        prefixes: list of str
+            the prefixes of the guild
+        """
+        return cls([f'<@{user_id}> ', f'<@!{user_id}> ', *prefixes])
+
+    def match(self, content):
+        """Find the longest prefix that a message starts with.
+
+        Returns
+        -------
+        the matching prefix, or None if the message does not start
+        with any prefix
+        """
+        node = self._root
+        matched = None
+
+        for char in content:
+            node = node.get(char)
+            if node is None:
+                break
+            matched = node.get(_END, matched)
+
+        return matched
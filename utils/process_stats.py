@@ -0,0 +1,135 @@
+import asyncio
+import collections
+import math
+import time
+import psutil
+
+SPARK_CHARACTERS = '▁▂▃▄▅▆▇█'
+
+
+class ProcessSample:
+    """The resource usage of the bot's process at one point in time."""
+    __slots__ = ('time', 'cpu', 'rss', 'uss', 'fds', 'tasks', 'loop_lag', 'latency')
+
+    def __init__(self, time, cpu, rss, uss, fds, tasks, loop_lag, latency):
+        self.time = time
+        self.cpu = cpu
+        self.rss = rss
+        self.uss = uss
+        self.fds = fds
+        self.tasks = tasks
+        self.loop_lag = loop_lag
+        self.latency = latency
+
+
+def _read_process(process):
+    # memory_full_info reads /proc/<pid>/smaps, which is slow for a
+    # large process, so this runs in an executor
+    cpu = process.cpu_percent()
+    try:
+        memory = process.memory_full_info()
+        rss, uss = memory.rss, memory.uss
+    except psutil.AccessDenied:
+        rss = process.memory_info().rss
+        uss = None
+
+    try:
+        fds = process.num_fds()
+    except AttributeError:
+        # num_fds is not available on Windows
+        fds = process.num_handles()
+    return cpu, rss, uss, fds
+
+
+def sparkline(values):
+    """Draw a list of numbers as a line of block characters scaled
+    between the smallest and largest value."""
+    if not values:
+        return ''
+
+    low, high = min(values), max(values)
+    scale = (len(SPARK_CHARACTERS) - 1) / (high - low) if high > low else 0
+    return ''.join(SPARK_CHARACTERS[round((value - low) * scale)] for value in values)
+
+
+class ProcessStatsSampler:
+    """Samples the resource usage of the bot's process in the
+    background, so commands that show it only read the latest samples.
+
+    Args
+    ----
+    bot:
+        the bot, used for the event loop lag and gateway latency
+    interval: float
+        the number of seconds between samples
+    history: int
+        the number of most recent samples to keep
+    """
+
+    def __init__(self, bot, *, interval=10.0, history=360):
+        self.bot = bot
+        self.interval = interval
+
+        self.samples = collections.deque(maxlen=history)
+        self.total_memory = psutil.virtual_memory().total
+        self.cluster_stats = None
+        self._task = None
+
+    @property
+    def latest(self):
+        return self.samples[-1] if self.samples else None
+
+    def start(self):
+        # The first call to cpu_percent always returns 0, since it
+        # measures the usage since the previous call
+        self.bot.process.cpu_percent()
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sample()
+            except Exception as e:
+                print(f'Failed to sample process stats: {e}')
+
+    async def sample(self):
+        loop = asyncio.get_event_loop()
+        cpu, rss, uss, fds = await loop.run_in_executor(None, _read_process, self.bot.process)
+
+        latency = self.bot.latency
+        self.samples.append(ProcessSample(
+            time=time.monotonic(),
+            cpu=cpu,
+            rss=rss,
+            uss=uss,
+            fds=fds,
+            tasks=len(asyncio.all_tasks()),
+            loop_lag=self.bot.watchdog.lag,
+            latency=None if math.isnan(latency) else latency))
+        self.cluster_stats = await self.bot.cluster_stats()
+
+    def window(self, seconds):
+        """
+        Returns
+        -------
+        the samples taken in the last number of seconds
+        """
+        since = time.monotonic() - seconds
+        return [sample for sample in self.samples if sample.time >= since]
+
+    def average(self, field, seconds):
+        """
+        Returns
+        -------
+        the mean of a field over the samples taken in the last number
+        of seconds, or None if there are no such samples
+        """
+        values = [getattr(sample, field) for sample in self.window(seconds)]
+        values = [value for value in values if value is not None]
+        return sum(values) / len(values) if values else None
@@ -0,0 +1,101 @@
+import collections
+import sys
+import threading
+
+
+def _is_idle(function):
+    # An event loop waiting in select() for I/O is idle, not busy
+    return function.startswith('select (') and 'selectors.py' in function
+
+
+class SamplingProfiler:
+    """Profiles a thread by sampling its stack from another thread at a
+    fixed interval.
+
+    The profiled thread keeps running normally. The only overhead is
+    the sampling thread briefly holding the GIL to walk the stack.
+
+    Args
+    ----
+    thread_id: int
+        the id of the thread to profile
+    interval: float
+        the number of seconds between samples
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+
+        self.samples = 0
+        self.idle_samples = 0
+        self.stacks = collections.Counter()
+
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _sample(self):
+        own_thread_id = threading.get_ident()
+
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or self.thread_id == own_thread_id:
+                continue
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            stack.reverse()
+
+            self.stacks[tuple(stack)] += 1
+            self.samples += 1
+            if _is_idle(stack[-1]):
+                self.idle_samples += 1
+
+    def top(self, limit=20):
+        """Find the functions that appear in the most samples, leaving
+        out the samples where the event loop was idle.
+
+        Returns
+        -------
+        a list of (function, self samples, cumulative samples) tuples,
+        with the most cumulative samples first
+        """
+        own = collections.Counter()
+        cumulative = collections.Counter()
+
+        for stack, count in self.stacks.items():
+            if _is_idle(stack[-1]):
+                continue
+
+            own[stack[-1]] += count
+            # Recursive functions are only counted once per sample
+            for function in set(stack):
+                cumulative[function] += count
+
+        functions = sorted(cumulative, key=lambda function: (cumulative[function], own[function]),
+                           reverse=True)
+        return [(function, own[function], cumulative[function]) for function in functions[:limit]]
+
+    def collapsed_stacks(self):
+        """
+        Returns
+        -------
+        the samples in the collapsed stack format used by flame graph
+        tools, with one line per unique stack
+        """
+        return '\n'.join(f'{";".join(stack)} {count}'
+                         for stack, count in self.stacks.most_common()) + '\n'
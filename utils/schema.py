@@ -0,0 +1,65 @@
+# An arbitrary key for the advisory lock held while migrating
+MIGRATION_LOCK_ID = 0x7264626f74
+
+MIGRATIONS = [
+    # 1: initial tables
+    ('create table if not exists prefixes(guild_id bigint PRIMARY KEY, prefixes text[]);',
+     'create table if not exists tags(id SERIAL PRIMARY KEY, name text, owner bigint, guild_id bigint, content text);'),
+
+    # 2: unique tag names per guild, and an index for listing owned tags
+    ('delete from tags a using tags b where a.guild_id = b.guild_id and a.name = b.name and a.id > b.id;',
+     'create unique index if not exists tags_guild_id_name_idx on tags(guild_id, name);',
+     'create index if not exists tags_guild_id_owner_name_idx on tags(guild_id, owner, name);'),
+
+    # 3: trigram index for suggesting similar tag names
+    ('create extension if not exists pg_trgm;',
+     'create extension if not exists btree_gin;',
+     'create index if not exists tags_guild_id_name_trgm_idx on tags using gin(guild_id, name gin_trgm_ops);'),
+
+    # 4: full text search over tag names and contents
+    ('alter table tags add column if not exists search tsvector;',
+     "update tags set search = to_tsvector('pg_catalog.english', coalesce(name, '') || ' ' || coalesce(content, ''));",
+     'drop trigger if exists tags_search_update on tags;',
+     '''create trigger tags_search_update before insert or update of name, content on tags
+        for each row execute procedure tsvector_update_trigger(search, 'pg_catalog.english', name, content);''',
+     'create index if not exists tags_guild_id_search_idx on tags using gin(guild_id, search);'),
+
+    # 5: tag usage statistics
+    ('alter table tags add column if not exists uses integer not null default 0;',
+     'alter table tags add column if not exists last_used timestamp;',
+     'create index if not exists tags_guild_id_uses_idx on tags(guild_id, uses desc, name);'),
+]
+
+
+async def migrate(pool):
+    """Bring the database schema up to date.
+
+    Each migration runs at most once, in order, and the version that
+    has been applied is recorded in the ``schema_version`` table. An
+    advisory lock is held while migrating, including while creating
+    that table, so that multiple processes starting at the same time
+    against a new database do not run the same statements at once.
+
+    Args
+    ----
+    pool:
+        the database connection pool
+
+    Returns
+    -------
+    the version of the schema after migrating
+    """
+    async with pool.acquire() as connection:
+        async with connection.transaction():
+            await connection.execute('select pg_advisory_xact_lock($1);', MIGRATION_LOCK_ID)
+            await connection.execute('create table if not exists schema_version(version integer PRIMARY KEY);')
+
+            version = await connection.fetchval('select coalesce(max(version), 0) from schema_version;')
+
+            for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+                for statement in statements:
+                    await connection.execute(statement)
+                await connection.execute('insert into schema_version(version) values($1);', number)
+                version = number
+
+    return version
@@ -0,0 +1,239 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from PIL import Image
+from utils.cache import LRUCache
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(link):
+    """Normalize a link so that links to the same page share a cache
+    entry.
+
+    The scheme and host are lowercased, default ports are dropped, an
+    empty path becomes ``/``, and query parameters are sorted. User info
+    and fragments are kept, since they can change what the page shows.
+
+    Raises
+    ------
+    ValueError:
+        if the link has an invalid port
+    """
+    parts = urlsplit(link.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    if parts.port is not None and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    if parts.username is not None or parts.password is not None:
+        user_info = parts.netloc.rpartition('@')[0]
+        host = f'{user_info}@{host}'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or '/', query, parts.fragment))
+
+
+def compress_image(data, max_width, image_format):
+    """Downscale a screenshot to a maximum width and re-encode it.
+
+    Returns
+    -------
+    the encoded image as bytes
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert('RGB')
+        if image.width > max_width:
+            height = round(image.height * max_width / image.width)
+            image = image.resize((max_width, height), Image.LANCZOS)
+
+        output = io.BytesIO()
+        if image_format == 'webp':
+            image.save(output, 'WEBP', quality=80, method=4)
+        else:
+            image.save(output, 'PNG', optimize=True)
+        return output.getvalue()
+
+
+def _scan(directory):
+    entries = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((name, stat.st_size, stat.st_mtime))
+    return entries
+
+
+def _read(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def _write(path, data):
+    # Each write gets its own temporary file, so two writes of the same
+    # screenshot at once cannot interleave or move each other's file
+    directory, name = os.path.split(path)
+    file = tempfile.NamedTemporaryFile(dir=directory, prefix=name, suffix='.tmp', delete=False)
+    try:
+        with file:
+            file.write(data)
+        os.replace(file.name, path)
+    except BaseException:
+        os.remove(file.name)
+        raise
+
+
+def _remove(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class ScreenshotCache:
+    """Caches compressed screenshots by page and viewport, in a small
+    in-memory tier in front of a larger tier on disk.
+
+    Entries on disk expire after the time to live, and the oldest
+    entries are removed once the files take up more than the size
+    limit. All file access and image encoding runs in an executor.
+
+    Args
+    ----
+    directory: str
+        the directory to store screenshots in
+    memory_size: int
+        the number of screenshots to keep in memory
+    max_bytes: int
+        the most bytes of screenshots to keep on disk
+    ttl: float
+        the number of seconds a screenshot stays valid
+    max_width: int
+        the width screenshots are downscaled to
+    image_format: str
+        ``webp`` or ``png``
+    """
+
+    def __init__(self, directory, *, memory_size=32, max_bytes=256 * 1024 ** 2, ttl=3600.0,
+                 max_width=1280, image_format='webp'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_width = max_width
+        self.image_format = image_format
+
+        self.memory = LRUCache(memory_size, ttl)
+        # Key -> (size, creation time), oldest first
+        self._files = OrderedDict()
+        self._disk_bytes = 0
+        self._loaded = False
+
+        self.disk_hits = 0
+        self.disk_misses = 0
+
+    def key(self, link, viewport):
+        normalized = f'{normalize_url(link)}\n{viewport}'
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.{self.image_format}')
+
+    async def _run(self, function, *args):
+        return await asyncio.get_event_loop().run_in_executor(None, function, *args)
+
+    async def load(self):
+        """Index the screenshots already on disk."""
+        if self._loaded:
+            return
+        self._loaded = True
+
+        await self._run(lambda: os.makedirs(self.directory, exist_ok=True))
+        suffix = f'.{self.image_format}'
+        entries = await self._run(_scan, self.directory)
+        for name, size, created in sorted(entries, key=lambda entry: entry[2]):
+            if name.endswith(suffix):
+                self._files[name[:-len(suffix)]] = (size, created)
+                self._disk_bytes += size
+        await self._evict()
+
+    async def _evict(self):
+        expired_before = time.time() - self.ttl
+        removed = []
+        while self._files:
+            key, (size, created) = next(iter(self._files.items()))
+            if created > expired_before and self._disk_bytes <= self.max_bytes:
+                break
+            del self._files[key]
+            self._disk_bytes -= size
+            removed.append(self._path(key))
+
+        if removed:
+            await self._run(_remove, removed)
+
+    async def get(self, link, viewport):
+        """
+        Returns
+        -------
+        the cached screenshot as bytes, or None if it is not cached
+        """
+        key = self.key(link, viewport)
+        data = self.memory.get(key)
+        if data is not LRUCache.MISSING:
+            return data
+
+        await self.load()
+        entry = self._files.get(key)
+        if entry is None or entry[1] <= time.time() - self.ttl:
+            self.disk_misses += 1
+            return None
+
+        try:
+            data = await self._run(_read, self._path(key))
+        except FileNotFoundError:
+            if self._files.pop(key, None) is not None:
+                self._disk_bytes -= entry[0]
+            self.disk_misses += 1
+            return None
+
+        self.disk_hits += 1
+        self.memory.set(key, data)
+        return data
+
+    async def put(self, link, viewport, screenshot):
+        """Compress a screenshot and add it to the cache.
+
+        Returns
+        -------
+        the compressed screenshot as bytes
+        """
+        key = self.key(link, viewport)
+        data = await self._run(compress_image, screenshot, self.max_width, self.image_format)
+        self.memory.set(key, data)
+
+        await self.load()
+        await self._run(_write, self._path(key), data)
+
+        old = self._files.pop(key, None)
+        if old is not None:
+            self._disk_bytes -= old[0]
+        self._files[key] = (len(data), time.time())
+        self._disk_bytes += len(data)
+        await self._evict()
+
+        return data
+
+    def stats(self):
+        return {
+            'memory': self.memory.stats(),
+            'disk_files': len(self._files),
+            'disk_bytes': self._disk_bytes,
+            'disk_hits': self.disk_hits,
+            'disk_misses': self.disk_misses
+        }
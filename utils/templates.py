@@ -0,0 +1,46 @@
+import re
+
+
+variable_rx = re.compile(r'\{(user|server|channel|args)\}')
+
+
+class Template:
+    """Text with variables such as ``{user}`` that are filled in when
+    the text is rendered.
+
+    The text is split into its literal parts and variable names once,
+    when the template is created, so rendering never has to search the
+    text again. Text without any variables renders to itself without
+    copying.
+
+    Args
+    ----
+    text: str
+        the text of the template
+    """
+    __slots__ = ('literals', 'variables')
+
+    def __init__(self, text):
+        # re.split with a capturing group alternates between literal
+        # text and the captured variable names
+        parts = variable_rx.split(text or '')
+        self.literals = parts[0::2]
+        self.variables = parts[1::2]
+
+    def render(self, **values):
+        """Fill in the variables of the template.
+
+        Variables without a value are replaced with an empty string.
+
+        Returns
+        -------
+        the rendered text
+        """
+        if not self.variables:
+            return self.literals[0]
+
+        rendered = [self.literals[0]]
+        for variable, literal in zip(self.variables, self.literals[1:]):
+            rendered.append(values.get(variable, ''))
+            rendered.append(literal)
+        return ''.join(rendered)
@@ -0,0 +1,107 @@
+import asyncio
+import collections
+import datetime
+import sys
+import threading
+import time
+import traceback
+from utils.metrics import Histogram
+
+
+class BlockedLoopReport:
+    """What the event loop was doing while it was blocked."""
+    __slots__ = ('time', 'duration', 'stack')
+
+    def __init__(self, duration, stack):
+        self.time = datetime.datetime.utcnow()
+        self.duration = duration
+        self.stack = stack
+
+
+class LoopWatchdog:
+    """Measures how late the event loop runs its callbacks, and records
+    what the loop was running whenever it is blocked for too long.
+
+    A task on the loop records a heartbeat at a fixed interval, and the
+    delay of each heartbeat is the loop's lag. A separate thread checks
+    the heartbeat. A blocked loop cannot report on itself, so when the
+    heartbeat is late by more than the threshold, the thread captures
+    the stack of the loop's thread while it is still blocked.
+
+    Args
+    ----
+    interval: float
+        the number of seconds between heartbeats
+    threshold: float
+        how many seconds late a heartbeat must be to capture a report
+    max_reports: int
+        the number of most recent reports to keep
+    """
+
+    def __init__(self, *, interval=0.25, threshold=0.5, max_reports=20):
+        self.interval = interval
+        self.threshold = threshold
+
+        self.lag = 0.0
+        self.lag_histogram = Histogram()
+        self.reports = collections.deque(maxlen=max_reports)
+        self.blocked_count = 0
+
+        self._loop_thread_id = None
+        self._last_beat = time.monotonic()
+        self._pending_report = None
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start the watchdog. Must be called from the event loop's
+        thread."""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stopped.clear()
+
+        self._task = asyncio.ensure_future(self._beat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _beat(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+
+            self.lag = max(0.0, now - start - self.interval)
+            self.lag_histogram.observe(self.lag)
+            self._last_beat = now
+
+            # The report was captured while the loop was still blocked,
+            # so it is updated with how long the loop was blocked in total
+            report = self._pending_report
+            if report is not None:
+                report.duration = self.lag
+                self._pending_report = None
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval / 2):
+            late_by = time.monotonic() - self._last_beat - self.interval
+            if late_by < self.threshold or self._pending_report is not None:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+
+            stack = ''.join(traceback.format_stack(frame))
+            report = BlockedLoopReport(late_by, stack)
+            self._pending_report = report
+            self.reports.append(report)
+            self.blocked_count += 1
+
+            print(f'Event loop blocked for at least {1000 * late_by:.0f} ms:\n{stack}', file=sys.stderr)